@@ -0,0 +1,319 @@
+"""
+hardware free benchmarks for piardservo. the arduino path talks to a FakeArduino on a
+pseudo terminal and to pyserial's loop:// url, the raspberry pi path uses gpiozero's
+MockFactory, so the suite runs on any linux box.
+
+    python benchmarks/bench_piardservo.py
+    python benchmarks/bench_piardservo.py --only encoders --compare benchmarks/results/old.json
+
+results are saved as json in benchmarks/results so runs from different releases can be
+compared with --compare, which flags every throughput that dropped or latency that grew
+by more than --tolerance
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from piardservo import ServoContainer, ServoObject, ArduinoSerial, RPiWifi
+from piardservo.ard_helpers.encoders import TwoByteEncoder, CommaDelimitedEncoder, DeltaEncoder
+from piardservo.ard_helpers.decoders import TwoByteDecoder, CommaDelimitedDecoder, DeltaDecoder
+from fake_arduino import FakeArduino
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SERVO_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+# the mock pi board has gpio 2-27 free
+RPI_SERVO_COUNTS = (1, 2, 4, 8, 16, 26)
+# libraries import piardservo should leave alone until a backend needs them
+HEAVY_MODULES = ('gpiozero', 'pigpio', 'serial', 'numpy', 'asyncio')
+IMPORT_RUNS = 15
+
+
+def rate(function, min_time=0.2):
+    """
+    calls per second of function, repeating it until min_time has passed
+    """
+    n = 0
+    start = time.perf_counter()
+    elapsed = 0
+    batch = 1
+    while elapsed < min_time:
+        for _ in range(batch):
+            function()
+        n += batch
+        batch *= 2
+        elapsed = time.perf_counter() - start
+    return n / elapsed
+
+
+def latencies(function, n):
+    out = []
+    for _ in range(n):
+        tick = time.perf_counter()
+        function()
+        out.append(time.perf_counter() - tick)
+    return out
+
+
+def summarize(samples):
+    samples = sorted(samples)
+
+    def pct(q):
+        return samples[min(int(q / 100 * len(samples)), len(samples) - 1)]
+
+    return {
+        'writes_per_second': len(samples) / sum(samples),
+        'p50': pct(50),
+        'p90': pct(90),
+        'p99': pct(99),
+        'max': samples[-1],
+    }
+
+
+def bench_servo_object(args):
+    servo = ServoObject()
+    out = {}
+
+    def set_angle():
+        servo.angle = 30
+
+    def read_pulse_width():
+        return servo.pulse_width
+
+    def read_value():
+        return servo.value
+
+    def set_pulse_width():
+        servo.pulse_width = 1600
+
+    for name, function in (('set_angle', set_angle),
+                           ('read_pulse_width', read_pulse_width),
+                           ('read_value', read_value),
+                           ('set_pulse_width', set_pulse_width)):
+        out[name] = rate(function, args.min_time)
+    return out
+
+
+def pairs_n(n, offset=0):
+    return [(1000 + 15 * i + offset, i) for i in range(n)]
+
+
+def bench_encoders(args):
+    out = {}
+    for n in SERVO_COUNTS:
+        if n <= 32:
+            pairs = [(1000 + 15 * i, i) for i in range(n)]
+            encoder = TwoByteEncoder()
+            out[f'two_byte_{n}'] = rate(lambda: encoder.encode_data(pairs), args.min_time)
+            buffer = bytearray(encoder.max_frame_size(n))
+            out[f'two_byte_into_{n}'] = rate(lambda: encoder.encode_into(pairs, buffer), args.min_time)
+
+        encoder = DeltaEncoder(n_channels=max(n, 8), deltas=False, keyframe_interval=0)
+        encoder.encode_data(pairs_n(n, 0))
+        frames = [pairs_n(n, k) for k in (1, 2)]
+        k = [0]
+
+        def encode_delta():
+            k[0] ^= 1
+            encoder.encode_data(frames[k[0]])
+
+        out[f'delta_{n}'] = rate(encode_delta, args.min_time)
+
+        flat = [x for i in range(n) for x in (i, 1000 + 15 * i)]
+        encoder = CommaDelimitedEncoder()
+        out[f'comma_delimited_{n}'] = rate(lambda: encoder.encode_data(flat), args.min_time)
+    return out
+
+
+def _drive(container, args, after_write=None):
+    """
+    moves every servo once per write and measures each write
+    """
+    k = [0]
+    n = container.n
+
+    def move():
+        k[0] += 1
+        container.set_angles([(k[0] + i) % 90 for i in range(n)])
+        if after_write is not None:
+            after_write()
+
+    move()
+    return summarize(latencies(move, args.writes))
+
+
+def bench_arduino(args):
+    out = {}
+    for n in SERVO_COUNTS:
+        for encoder, decoder, name in ((TwoByteEncoder, TwoByteDecoder, 'two_byte'),
+                                       (CommaDelimitedEncoder, CommaDelimitedDecoder, 'comma_delimited'),
+                                       (lambda: DeltaEncoder(n_channels=n), lambda: DeltaDecoder(n), 'delta')):
+            if name == 'two_byte' and n > 32:
+                continue
+            for window in (1, 8):
+                with FakeArduino(decoder(), windowed=window > 1) as fake:
+                    ard = ArduinoSerial(address=fake.address, n=n, encoder=encoder(), window=window,
+                                        write_on_update=False)
+                    container = ServoContainer(n=n, microcontroller=ard).connect()
+                    result = _drive(container, args)
+                    ard.flush()
+                    container.close()
+                out[f'{name}_window{window}_{n}'] = result
+    return out
+
+
+def bench_loopback(args):
+    """
+    raw encode and transmit cost with no acks. pyserial's loop:// echoes into a bounded
+    buffer that blocks writes once full, so it is emptied after every write
+    """
+    out = {}
+    for n in SERVO_COUNTS:
+        ard = ArduinoSerial(address='loop://', n=n, encoder='comma_delimited', wait=False,
+                            write_on_update=False)
+        container = ServoContainer(n=n, microcontroller=ard).connect()
+        result = _drive(container, args, ard.port.connection.reset_input_buffer)
+        container.close()
+        out[f'comma_delimited_{n}'] = result
+    return out
+
+
+def bench_rpi(args):
+    from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+    out = {}
+    for n in RPI_SERVO_COUNTS:
+        factory = MockFactory(pin_class=MockPWMPin)
+        rpi = RPiWifi(address=f'mock{n}', pins=tuple(range(2, 2 + n)), pin_factory=factory,
+                      write_on_update=False)
+        container = ServoContainer(n=n, microcontroller=rpi).connect()
+        out[f'mock_{n}'] = _drive(container, args)
+        container.close()
+    return out
+
+
+_IMPORT_SCRIPT = '''
+import sys, time
+tick = time.perf_counter()
+import piardservo
+elapsed = time.perf_counter() - tick
+print(elapsed, sum(m in sys.modules for m in {modules!r}))
+'''
+
+
+def bench_import(args):
+    """
+    cold import of the package in fresh interpreters, heavy_modules counts the optional
+    libraries it pulled in and should stay 0
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _IMPORT_SCRIPT.format(modules=HEAVY_MODULES)
+
+    samples = []
+    heavy = 0
+    for _ in range(IMPORT_RUNS):
+        out = subprocess.run([sys.executable, '-c', script], cwd=root, check=True,
+                             capture_output=True, text=True).stdout.split()
+        samples.append(float(out[0]))
+        heavy = max(heavy, int(out[1]))
+
+    samples.sort()
+    return {
+        'p50': samples[len(samples) // 2],
+        'max': samples[-1],
+        'heavy_modules': heavy,
+    }
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'servo_object': bench_servo_object,
+    'encoders': bench_encoders,
+    'loopback': bench_loopback,
+    'arduino': bench_arduino,
+    'rpi': bench_rpi,
+}
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        else:
+            yield f'{prefix}{key}', value
+
+
+def compare(results, baseline, tolerance):
+    """
+    lists every metric that got worse by more than tolerance, rates should not drop and
+    latencies should not grow
+    """
+    old = dict(_flatten(baseline['results']))
+    regressions = []
+    for key, new in _flatten(results):
+        if key not in old or not isinstance(new, (int, float)):
+            continue
+        higher_is_better = not key.rsplit('.', 1)[-1] in ('p50', 'p90', 'p99', 'max', 'heavy_modules')
+        if not old[key]:
+            # nothing to scale against, only growth from zero counts
+            if new > 0 and not higher_is_better:
+                regressions.append((key, old[key], new, float('inf')))
+            continue
+        change = (new - old[key]) / old[key]
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append((key, old[key], new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per throughput measurement')
+    parser.add_argument('--writes', type=int, default=200, help='writes per latency measurement')
+    parser.add_argument('--output', help='json file to save results to, defaults to results/<time>.json')
+    parser.add_argument('--compare', help='earlier results json to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative change before flagging')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f'running {name}')
+        try:
+            results[name] = BENCHMARKS[name](args)
+        except ImportError as exc:
+            print(f'  skipped, {exc}')
+            continue
+        for key, value in _flatten(results[name]):
+            print(f'  {key:40s} {value:14.6g}')
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'saved {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, old, new, change in regressions:
+            print(f'REGRESSION {key}: {old:.6g} -> {new:.6g} ({change:+.0%})')
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+pseudo terminal that behaves like an arduino running the piardservo sketch. it decodes
+every frame written to it with the reference decoders and acks each one, so the serial
+backend can be exercised without hardware
+"""
+import os
+import pty
+import select
+import threading
+import tty
+
+from piardservo.ard_helpers.decoders import SequencedDecoder
+from piardservo.ard_helpers.telemetry import encode_ack, encode_telemetry
+
+
+class FakeArduino:
+
+    def __init__(self, decoder, windowed=False, handshake=0.2, telemetry=False):
+        """
+        handshake is how long after start() the ready byte is sent, like a board booting
+        after the port opens. pyserial flushes the input when it opens the port, so it
+        has to be opened within that time. None sends no ready byte
+
+        telemetry=True frames acks the way a telemetry sketch does, feedback is sent
+        with send_telemetry
+        """
+        self.decoder = SequencedDecoder(decoder) if windowed else decoder
+        self.windowed = windowed
+        self.telemetry = telemetry
+        self._write_lock = threading.Lock()
+        self.handshake = handshake
+        self.frames = []
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.address = os.ttyname(self._slave)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        # join before closing so the reader can't end up on a reused descriptor
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _run(self):
+        if self.handshake is not None:
+            if self._stop.wait(self.handshake):
+                return
+            self._write(b'\x01')
+
+        while not self._stop.is_set():
+            if not select.select([self._master], [], [], 0.05)[0]:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+
+            acks = bytearray()
+            for frame in self.decoder.feed(data):
+                self.frames.append(frame)
+                acks += SequencedDecoder.ack(frame) if self.windowed else b'\x01'
+
+            if acks:
+                self._write(acks)
+
+    def send_telemetry(self, channel, position, current=0, load=0):
+        self._write(encode_telemetry(channel, position, current, load), framed=True)
+
+    def _write(self, data, framed=False):
+        if self.telemetry and not framed:
+            data = b''.join(encode_ack(ack) for ack in data)
+        with self._write_lock:
+            os.write(self._master, bytes(data))
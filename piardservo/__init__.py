@@ -1,11 +1,48 @@
 """
 standalone servo controller package that provides servo  controls for raspberry pi and Arduino as well as a
 proportional, integrate, derivative controller
+
+the modules that need numpy are imported the first time they are used, and the backends
+only load gpiozero and pyserial when they connect, so importing the package is fast and
+needs none of the hardware libraries
 """
-import piardservo.microcontrollers as microcontrollers
+import importlib
+
 import piardservo.container as container
 import piardservo.servo_object as servo_object
 
 from piardservo.container import ServoContainer
 from piardservo.servo_object import ServoObject
-from piardservo.microcontrollers import RPiWifi
+
+# name -> module it comes from, resolved by __getattr__ on first use
+_lazy = {
+    'RPiWifi': 'piardservo.microcontrollers',
+    'ArduinoSerial': 'piardservo.microcontrollers',
+    'MicroControllerGroup': 'piardservo.microcontrollers',
+    'ArrayServoContainer': 'piardservo.array_container',
+    'Trajectory': 'piardservo.trajectory',
+    'TrajectoryPlayer': 'piardservo.trajectory',
+    'PIDController': 'piardservo.pid',
+    'VectorPIDController': 'piardservo.pid',
+    'ControlLoop': 'piardservo.loop',
+    'Recorder': 'piardservo.recorder',
+    'Replayer': 'piardservo.recorder',
+    'SimulatedMicroController': 'piardservo.simulation',
+    'TrackingStage': 'piardservo.tracking',
+}
+
+__all__ = ['ServoContainer', 'ServoObject'] + list(_lazy)
+
+
+def __getattr__(name):
+    module = _lazy.get(name)
+    if module is None:
+        raise AttributeError(f"module 'piardservo' has no attribute '{name}'")
+
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy))
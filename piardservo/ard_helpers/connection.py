@@ -1,55 +1,108 @@
 import platform
-import gc
 import time
+import threading
+import weakref
+from collections import OrderedDict, deque
 
-try:
-    import serial
-except:
-    print("Arduino Servo Dependency, pyserial, Not Found")
+from piardservo.metrics import NULL_METRICS
+from piardservo.servotools import require
+from piardservo.ard_helpers.telemetry import TelemetryParser, TelemetryBuffer
+
+
+class SerialAckError(Exception):
+    """
+    raised when a windowed frame is not acknowledged by the arduino
+    """
+
+    def __init__(self, seq, message):
+        super().__init__(f"frame {seq}: {message}")
+        self.seq = seq
+
+
+class _SharedConnection:
+    """
+    an open serial connection and how many ArduinoSerialPorts are using it. lock serializes
+    a write and its ack between the ports
+    """
+
+    def __init__(self, connection, baud_rate):
+        self.connection = connection
+        self.baud_rate = baud_rate
+        self.users = 0
+        self.exclusive = False
+        self.lock = threading.Lock()
 
 
 class ArduinoSerialPort:
-    _serial_objects = []
+    # device path -> _SharedConnection for every port the library has open. entries hold
+    # no strong reference, so they go away with the last ArduinoSerialPort using them
+    _registry = weakref.WeakValueDictionary()
 
     @classmethod
     def close_all(cls):
         """
-        class method to close all open serial.Serial objects
+        class method to close all serial ports opened by the library
         """
-        for p in cls._serial_objects:
-            p.close()
-        cls._serial_objects = []
+        for shared in list(cls._registry.values()):
+            shared.connection.close()
+        cls._registry.clear()
 
     @classmethod
     def remove_closed(cls):
         """
-        class method to remove all closed serial.Serial objects from cls._serial_objects class attribute
+        class method to drop closed serial ports from the registry
         """
-        open_ports = []
-        for p in cls._serial_objects:
-            if p.is_open:
-                open_ports.append(p)
-        cls._serial_objects = open_ports
+        for address, shared in list(cls._registry.items()):
+            if not shared.connection.is_open:
+                cls._registry.pop(address, None)
 
-    @staticmethod
-    def find_and_close_all():
+    @classmethod
+    def find_and_close_all(cls):
         """
-        static method that searches all instantiated objects for serial.Serial
-        objects and closes them all. 
-        
+        closes every serial port opened by the library. kept for compatibility, it used to
+        scan the whole heap for serial objects
         """
-        for o in gc.get_objects():
-            if isinstance(o, serial.Serial):
-                o.close()
+        cls.close_all()
 
-    @staticmethod
-    def find_all_open():
+    @classmethod
+    def find_all_open(cls):
         """
-        static method to return all open serial.Serial objects
+        returns all open serial objects opened by the library
         """
-        return [o for o in gc.get_objects() if isinstance(o, serial.Serial) and o.is_open]
-
-    def __init__(self, address=3, baud_rate=9600, time_out=1, debug=False, min_wait=5):
+        return [shared.connection for shared in list(cls._registry.values()) if shared.connection.is_open]
+
+    def __init__(self,
+                 address=3,
+                 baud_rate=9600,
+                 time_out=1,
+                 debug=False,
+                 min_wait=5,
+                 window=1,
+                 frame_timeout=1,
+                 on_error=None,
+                 telemetry=False,
+                 telemetry_size=4096,
+                 share=True
+                 ):
+        """
+        window > 1 switches the port into pipelined mode. every frame is prefixed with a
+        one byte sequence number, up to window frames may be waiting for their ack at once
+        and acks, which the arduino sends back as the sequence byte, are matched to frames
+        on a background reader thread. frames that are not acked within frame_timeout
+        seconds are reported through on_error(SerialAckError) and the errors deque
+
+        telemetry=True expects the board to frame what it sends, see ard_helpers.telemetry.
+        the background reader then parses feedback into the TelemetryBuffer at
+        self.telemetry, which holds the last telemetry_size records, and hands acks to
+        the write path separately
+
+        share=True lets ports on the same device use one connection, so a second
+        container can attach without reopening the port, which resets the arduino. it
+        is closed when the last port using it closes. windowed and telemetry ports need
+        the connection to themselves. share=False closes and reopens the port
+        """
+        if not 1 <= window < self._seq_modulus:
+            raise ValueError(f"window must be between 1 and {self._seq_modulus - 1}")
 
         self.address = self._find_prefix(address)
 
@@ -62,13 +115,38 @@ class ArduinoSerialPort:
 
         self.min_wait = min_wait
 
+        self.window = window
+        self.frame_timeout = frame_timeout
+        self.on_error = on_error
+        self.errors = deque(maxlen=100)
+        self.metrics = NULL_METRICS
+        self.share = share
+        self._shared = None
+        # held across a write and its ack, the shared connection's lock once connected
+        self._io_lock = threading.Lock()
+
+        self.telemetry = TelemetryBuffer(telemetry_size) if telemetry is True else None
+        self._parser = TelemetryParser() if telemetry is True else None
+
+        self._seq = 0
+        self._in_flight = OrderedDict()
+        # acks received by the reader while not windowed. writes with wait=False never
+        # take theirs, so only keep the latest few
+        self._acks = deque(maxlen=16)
+        self._ack_condition = threading.Condition()
+        self._reader = None
+        self._reader_stop = threading.Event()
+
+    _seq_modulus = 256
+    _reader_poll = 0.05
+
     @property
     def serial_objects(self):
-        return self._serial_objects
+        return self.find_all_open()
 
     @property
     def is_open(self):
-        if isinstance(self.connection, serial.Serial) and self.connection.is_open:
+        if self.connection is not False and self.connection.is_open:
             return True
         else:
             return False
@@ -91,29 +169,72 @@ class ArduinoSerialPort:
         if self.is_open:
             self.close()
 
-        else:
-            open_ports = self.find_all_open()
-
-            for port in open_ports:
-                if port.port == new_address:
-                    port.close()
-
-            self.remove_closed()
-
-        self.connection = serial.Serial(new_address, new_baud, timeout=self.time_out)
+        exclusive = self.windowed or self.telemetry is not None
+        shared = self._registry.get(new_address)
+        if shared is not None and not shared.connection.is_open:
+            shared = None
 
-        self._wait_for_response(wait)
+        if shared is not None and self.share and not exclusive and not shared.exclusive:
+            if shared.baud_rate != new_baud:
+                raise ValueError(f"{new_address} is already open at {shared.baud_rate} baud")
+            # already open and past the handshake
+            self.connection = shared.connection
 
+        else:
+            if shared is not None:
+                if shared.exclusive or exclusive:
+                    if self.share:
+                        raise ValueError(f"{new_address} is already open, windowed and telemetry ports "
+                                         f"can't share a connection")
+                shared.connection.close()
+
+            # serial_for_url also opens pyserial urls such as loop:// and rfc2217://
+            serial = require('serial', 'Arduino Servo', 'pyserial')
+            connection = serial.serial_for_url(new_address, new_baud, timeout=timeout)
+            shared = _SharedConnection(connection, new_baud)
+            shared.exclusive = exclusive
+            self.connection = connection
+
+            try:
+                self._wait_for_response(wait)
+            except Exception:
+                connection.close()
+                self.connection = False
+                raise
+            self._registry[new_address] = shared
+
+        shared.users += 1
+        self._shared = shared
+        self._io_lock = shared.lock
         self.connected = True
-        self._serial_objects.append(self.connection)
+
+        if exclusive:
+            self._start_reader()
 
         if self.debug is True:
             print(f'servos connected to {self.address}')
 
+    @property
+    def windowed(self):
+        return self.window > 1
+
+    @property
+    def in_flight(self):
+        """
+        number of windowed frames still waiting for an ack
+        """
+        return len(self._in_flight)
+
     def close(self):
-        """close serial port"""
-        self.connection.close()
+        """close serial port, a shared connection stays open until its last port closes"""
+        self._stop_reader()
+        shared, self._shared = self._shared, None
+        if shared is not None:
+            shared.users -= 1
+        if shared is None or shared.users <= 0:
+            self.connection.close()
         self.connection = False
+        self.connected = False
         self.remove_closed()
 
     def write(self, message, wait=True, encoding='utf-8'):
@@ -122,51 +243,238 @@ class ArduinoSerialPort:
         write(self, message, wait=True, silent=True, encoding='utf-8')
         waits  for response wait is True and waits for x seconds if wait=x
         """
-        assert isinstance(message, (bytes, str))
+        assert isinstance(message, (bytes, bytearray, memoryview, str))
         if isinstance(message, str):
             message = message.encode(encoding)
 
-        if self.debug is True:
-            tick = time.time()
-
-        self.connection.write(message)
-        self._wait_for_response(wait)
-        tock = time.time() if self.debug is True else 0
+        if self.windowed:
+            return self._write_windowed(message, wait)
+
+        timed = self.debug is True or self.metrics.enabled
+        if timed:
+            tick = time.perf_counter()
+
+        # another port sharing the connection could otherwise take this ack
+        with self._io_lock:
+            if self._reader is not None:
+                # acks of unwaited or timed out writes must not confirm this one
+                with self._ack_condition:
+                    self._acks.clear()
+            self.connection.write(message)
+            if timed:
+                sent = time.perf_counter()
+
+            self._wait_for_response(wait)
+        if timed:
+            tock = time.perf_counter()
+            self.metrics.observe('transmit', sent - tick)
+            self.metrics.observe('ack', tock - sent)
 
         if self.debug is True:
-            print(f'{message} sent with confirmation in {tock - tick} seconds')
+            print(f'{bytes(message)} sent with confirmation in {tock - tick} seconds')
 
     def read(self):
         self.connection.read()
 
-    def _wait_for_response(self, wait=True, read=True, silent=True):
+    def flush(self, wait=True):
         """
-        helper function to wait for response received message from arduino
-        if max_wait = 0 or False, the 
-        
+        blocks until every windowed frame has been acked or has timed out and raises the
+        first SerialAckError recorded since the last flush
+        """
+        wait_time = self._wait_time(wait)
+
+        with self._ack_condition:
+            done = self._ack_condition.wait_for(lambda: not self._in_flight, timeout=wait_time)
+            errors = list(self.errors)
+            self.errors.clear()
+
+        if errors:
+            raise errors[0]
+        if not done:
+            raise Exception(f"{len(self._in_flight)} frames still in flight after max_wait={wait_time} seconds")
+
+    def _write_windowed(self, message, wait):
+        """
+        sends a sequence numbered frame without waiting for its ack. blocks only while
+        the window is full, raising if no slot opens within the wait time
         """
+        if self._reader is None:
+            raise RuntimeError("windowed writes need an open connection")
+
+        wait_time = self._wait_time(wait)
+
+        with self._ack_condition:
+            has_slot = self._ack_condition.wait_for(lambda: len(self._in_flight) < self.window,
+                                                    timeout=wait_time)
+            if not has_slot:
+                raise Exception(f"no free window slot within max_wait={wait_time} seconds")
+
+            seq = self._seq
+            self._seq = (seq + 1) % self._seq_modulus
+            self._in_flight[seq] = time.monotonic()
+            if self.metrics.enabled:
+                tick = time.perf_counter()
+                self.connection.write(bytes((seq,)) + message)
+                self.metrics.observe('transmit', time.perf_counter() - tick)
+            else:
+                self.connection.write(bytes((seq,)) + message)
+
+        if self.debug is True:
+            print(f'{bytes(message)} sent as frame {seq}')
+
+        return seq
+
+    def _wait_time(self, wait):
         if wait is True:
-            wait_time = self.min_wait
+            return self.min_wait
         elif isinstance(wait, (int, float)) and wait > 0:
-            wait_time = wait
+            return wait
         else:
+            return None
+
+    def _start_reader(self):
+        self.connection.timeout = self._reader_poll
+        self._seq = 0
+        self._in_flight.clear()
+        self._acks.clear()
+        self._reader_stop.clear()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _stop_reader(self):
+        if self._reader is None:
             return
 
-        tick = time.time()
-        total_time = 0
-        while not self.connection.inWaiting():
-            total_time = time.time() - tick
-            if total_time > wait_time:
-                raise Exception(f"no response received within max_wait={wait_time} seconds")
+        self._reader_stop.set()
+        self._reader.join()
+        self._reader = None
+
+        with self._ack_condition:
+            for seq in self._in_flight:
+                self._report(SerialAckError(seq, "connection closed before ack"))
+            self._in_flight.clear()
+            self._ack_condition.notify_all()
+
+    def _read_loop(self):
+        """
+        reader thread. takes whatever bytes have arrived, sorts them into acks and telemetry
+        and expires windowed frames that have waited too long
+        """
+        connection = self.connection
+        while not self._reader_stop.is_set():
+            try:
+                data = connection.read(max(connection.in_waiting, 1))
+            except Exception as exc:
+                with self._ack_condition:
+                    for seq in self._in_flight:
+                        self._report(SerialAckError(seq, f"read failed: {exc}"))
+                    self._in_flight.clear()
+                    self._ack_condition.notify_all()
+                return
+
+            now = time.monotonic()
+            with self._ack_condition:
+                if not data:
+                    pass
+                elif self._parser is None:
+                    for ack in data:
+                        self._on_ack(ack, now)
+                else:
+                    self._parser.feed(data, now, lambda ack: self._on_ack(ack, now), self.telemetry.append)
+                self._expire_frames(now)
+                self._ack_condition.notify_all()
+
+    def _on_ack(self, ack, now):
+        if self.windowed:
+            self._match_ack(ack, now)
+        else:
+            self._acks.append(ack)
+
+    def _match_ack(self, seq, now):
+        """
+        acks arrive in the order frames were sent, so every frame sent before an acked
+        frame has lost its ack
+        """
+        if seq not in self._in_flight:
+            self._report(SerialAckError(seq, "unexpected ack"))
+            return
+
+        while self._in_flight:
+            sent_seq, sent_at = self._in_flight.popitem(last=False)
+            if sent_seq == seq:
+                break
+            self._report(SerialAckError(sent_seq, "ack lost or out of order"))
+
+        self.metrics.observe('ack', now - sent_at)
+        if self.debug is True:
+            print(f'frame {seq} confirmed in {now - sent_at} seconds')
+
+    def _expire_frames(self, now):
+        while self._in_flight:
+            seq, sent_at = next(iter(self._in_flight.items()))
+            if now - sent_at <= self.frame_timeout:
+                break
+            del self._in_flight[seq]
+            self._report(SerialAckError(seq, f"no ack within frame_timeout={self.frame_timeout} seconds"))
+
+    def _report(self, error):
+        self.metrics.count('ack_errors')
+        self.errors.append(error)
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def _wait_for_response(self, wait=True, read=True, silent=True):
+        """
+        helper function to wait for response received message from arduino
+        if wait is True it waits up to min_wait seconds, if wait is a number it waits up
+        to that many seconds and if wait is 0 or False it returns immediately.
+
+        the wait is a single blocking read with the port timeout set to the deadline,
+        so the thread sleeps in the OS until a byte arrives instead of polling inWaiting
+        """
+        wait_time = self._wait_time(wait)
+        if wait_time is None:
+            return
+
+        if self._reader is not None:
+            return self._wait_for_reader_ack(wait_time, read, silent)
+
+        # only touch the port settings when the deadline changes, setting
+        # the timeout reconfigures the port
+        if self.connection.timeout != wait_time:
+            self.connection.timeout = wait_time
+
+        tick = time.monotonic()
+        response = self.connection.read(1)
+        total_time = time.monotonic() - tick
+
+        if not response:
+            raise Exception(f"no response received within max_wait={wait_time} seconds")
 
         if silent is False or self.debug is True:
             print(f"confirmation received after {round(total_time, 4)} seconds after message sent")
 
         if read is True:
-            return self.connection.read()
+            return response
         else:
             return True
 
+    def _wait_for_reader_ack(self, wait_time, read, silent):
+        """
+        _wait_for_response while the reader thread owns the port, waits for it to hand
+        over an ack
+        """
+        tick = time.monotonic()
+        with self._ack_condition:
+            if not self._ack_condition.wait_for(lambda: self._acks, timeout=wait_time):
+                raise Exception(f"no response received within max_wait={wait_time} seconds")
+            ack = self._acks.popleft()
+
+        if silent is False or self.debug is True:
+            print(f"confirmation received after {round(time.monotonic() - tick, 4)} seconds after message sent")
+
+        return bytes((ack,)) if read is True else True
+
     @staticmethod
     def _find_prefix(address):
         if isinstance(address, int):
@@ -0,0 +1,248 @@
+"""
+python reference decoders for the messages produced by encoders.py. they mirror what the
+arduino sketch does with the incoming bytes and are used to check round trips and frame
+ordering without hardware
+"""
+import abc
+
+from piardservo.ard_helpers.encoders import crc16, DeltaEncoder
+
+
+class Decoder(abc.ABC):
+
+    def __init__(self):
+        self.reset()
+
+    @abc.abstractmethod
+    def reset(self):
+        """
+        drop any partially decoded frame
+        """
+        pass
+
+    @abc.abstractmethod
+    def feed_byte(self, b):
+        """
+        consume one byte and return a decoded frame when it completes one, otherwise None
+        """
+        pass
+
+    def feed(self, data):
+        """
+        consume a chunk of bytes and return a list of every frame completed by it
+        """
+        frames = []
+        for b in data:
+            frame = self.feed_byte(b)
+            if frame is not None:
+                frames.append(frame)
+        return frames
+
+
+class CommaDelimitedDecoder(Decoder):
+    """
+    decodes b'<1,3,4>' into [1, 3, 4]. bytes outside of a begin/end pair are ignored
+    """
+
+    def __init__(self,
+                 begin_message='<',
+                 end_message='>',
+                 serial_format='utf-8'
+                 ):
+        self.begin_message = ord(begin_message)
+        self.end_message = ord(end_message)
+        self.serial_format = serial_format
+        super().__init__()
+
+    def reset(self):
+        self._buffer = None
+
+    def feed_byte(self, b):
+        if self._buffer is None:
+            if b == self.begin_message:
+                self._buffer = bytearray()
+            return None
+
+        if b != self.end_message:
+            self._buffer.append(b)
+            return None
+
+        message = self._buffer.decode(self.serial_format)
+        self._buffer = None
+        return [int(x) for x in message.split(',')] if message else []
+
+
+class TwoByteDecoder(Decoder):
+    """
+    decodes TwoByteEncoder messages back into a list of (pos, i) pairs.
+
+    a pair's high byte is pos >> 3, so the end byte is only unambiguous while no position
+    falls in 136-143, which holds for any pulse width outside of 136-143us
+    """
+
+    def __init__(self,
+                 begin_message=16,
+                 end_message=17
+                 ):
+        self.begin_message = begin_message
+        self.end_message = end_message
+        super().__init__()
+
+    def reset(self):
+        self._state = 'start'
+        self._pairs = []
+        self._high = None
+
+    def feed_byte(self, b):
+        if self._state == 'start':
+            if b == 0:
+                self._state = 'begin'
+            return None
+
+        if self._state == 'begin':
+            if b == self.begin_message:
+                self._state = 'high'
+                self._pairs = []
+            else:
+                self._state = 'begin' if b == 0 else 'start'
+            return None
+
+        if self._state == 'high':
+            if b == self.end_message:
+                frame = self._pairs
+                self.reset()
+                return frame
+            self._high = b
+            self._state = 'low'
+            return None
+
+        word = (self._high << 8) | b
+        self._pairs.append((word >> 5, word & 31))
+        self._state = 'high'
+        return None
+
+
+class SequencedDecoder(Decoder):
+    """
+    decodes the frames ArduinoSerialPort sends in windowed mode, a sequence byte followed
+    by an inner message, into (seq, frame) tuples. ack() returns the byte the arduino
+    should echo for a decoded frame
+    """
+
+    def __init__(self, decoder):
+        self.decoder = decoder
+        super().__init__()
+
+    def reset(self):
+        self.decoder.reset()
+        self._seq = None
+
+    def feed_byte(self, b):
+        if self._seq is None:
+            self._seq = b
+            return None
+
+        frame = self.decoder.feed_byte(b)
+        if frame is None:
+            return None
+
+        seq = self._seq
+        self._seq = None
+        return seq, frame
+
+    @staticmethod
+    def ack(decoded):
+        return bytes((decoded[0],))
+
+
+def cobs_decode(data):
+    """
+    reverses cobs_encode, raises ValueError on malformed input
+    """
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        code = data[i]
+        if code == 0 or i + code > len(data):
+            raise ValueError("malformed COBS data")
+        out += data[i + 1:i + code]
+        i += code
+        if code < 0xFF and i < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+class DeltaDecoder(Decoder):
+    """
+    decodes DeltaEncoder frames into {channel: position} dicts of the channels each frame
+    changed, positions holds the latest position of every channel. frames with a bad crc
+    or framing are counted in bad_frames and dropped, and delta frames are ignored after
+    that until the next keyframe
+    """
+
+    def __init__(self, n_channels=32):
+        self.n_channels = n_channels
+        self.mask_size = (n_channels + 7) // 8
+        self.bad_frames = 0
+        super().__init__()
+
+    def reset(self):
+        self._buffer = bytearray()
+        self.positions = {}
+        self._synced = False
+
+    def feed_byte(self, b):
+        if b != 0:
+            self._buffer.append(b)
+            return None
+
+        frame, self._buffer = bytes(self._buffer), bytearray()
+        try:
+            return self.decode_frame(frame)
+        except ValueError:
+            self.bad_frames += 1
+            self._synced = False
+            return None
+
+    def decode_frame(self, frame):
+        """
+        decodes one COBS encoded frame without its zero delimiter. returns None for a delta
+        frame that arrives while out of sync
+        """
+        payload = cobs_decode(frame)
+        if len(payload) < 3 + self.mask_size:
+            raise ValueError("frame too short")
+
+        body, crc = payload[:-2], int.from_bytes(payload[-2:], 'big')
+        if crc16(body) != crc:
+            raise ValueError("crc mismatch")
+
+        flags = body[0]
+        mask = int.from_bytes(body[1:1 + self.mask_size], 'little')
+        values = body[1 + self.mask_size:]
+        channels = [i for i in range(self.n_channels) if mask >> i & 1]
+
+        delta = flags & DeltaEncoder.DELTA
+        width = 1 if delta else 2
+        if len(values) != width * len(channels):
+            raise ValueError("payload length does not match the channel mask")
+
+        if flags & DeltaEncoder.KEYFRAME:
+            self._synced = True
+        elif not self._synced:
+            return None
+
+        changed = {}
+        for k, i in enumerate(channels):
+            if delta:
+                if i not in self.positions:
+                    raise ValueError(f"delta for channel {i} before any position")
+                step = values[k]
+                step = step - 256 if step > 127 else step
+                changed[i] = self.positions[i] + step
+            else:
+                changed[i] = int.from_bytes(values[2 * k:2 * k + 2], 'big')
+
+        self.positions.update(changed)
+        return changed
+
@@ -1,11 +1,58 @@
 import abc
 
 class Encoder(abc.ABC):
+    # 'flat' encoders take a channel, position, channel, position, ... list and 'pairs'
+    # encoders take (position, channel) pairs
+    data_format = 'flat'
 
     @abc.abstractmethod
     def encode_data(self, data):
         pass
 
+    def max_frame_size(self, n):
+        """
+        largest frame encode_data can produce for n channels, None when unbounded
+        """
+        return None
+
+    def reset(self):
+        """
+        forget any state kept between frames, called when a frame may not have arrived
+        """
+        pass
+
+    def encode_into(self, data, buffer, offset=0):
+        """
+        writes the frame for data into a writable buffer (bytearray, memoryview, ...)
+        starting at offset and returns the offset just past it. subclasses override this
+        to skip building the intermediate bytes object
+        """
+        message = self.encode_data(data)
+        end = offset + len(message)
+        if end > len(buffer):
+            raise ValueError(f"buffer too small, frame needs {end} bytes")
+        buffer[offset:end] = message
+        return end
+
+    def encode_many(self, frames, buffer=None, offset=0):
+        """
+        packs the frames for every data in frames back to back so they can go out in one
+        serial write. returns a memoryview of the packed bytes. without a buffer one
+        big enough is allocated
+        """
+        if buffer is None:
+            frames = list(frames)
+            # len(data) is at least the channel count for both data formats
+            sizes = [self.max_frame_size(len(data)) for data in frames]
+            if None in sizes:
+                return memoryview(b''.join(self.encode_data(data) for data in frames))
+            buffer = bytearray(offset + sum(sizes))
+
+        end = offset
+        for data in frames:
+            end = self.encode_into(data, buffer, end)
+        return memoryview(buffer)[offset:end]
+
 class CommaDelimitedEncoder(Encoder):
     """
     comma delimited data to serial encoding from python to arduino
@@ -34,15 +81,14 @@ class CommaDelimitedEncoder(Encoder):
         b'<1,3,4>
     
         """
-        encoded_message = self.begin_message
-        l = len(data)
-        for i, msg in enumerate(data):
-            encoded_message += str(msg)
-            if i < l-1: 
-                encoded_message += ','
-  
-        encoded_message += self.end_message
+        encoded_message = self.begin_message + ','.join(map(str, data)) + self.end_message
         return encoded_message.encode(self.serial_format)
+
+    def max_frame_size(self, n):
+        # None keeps ArduinoSerial on encode_data. writing the digits into a buffer from
+        # python is slower than join and encode, and copying that into a buffer only adds
+        # a copy
+        return None
     
     def encode_system_message(self, data):
         """
@@ -52,6 +98,11 @@ class CommaDelimitedEncoder(Encoder):
 
 
 class TwoByteEncoder(Encoder):
+    """
+    packs each (position, channel) pair into two bytes as position << 5 | channel, so
+    channels go up to 31 and positions up to 2047
+    """
+    data_format = 'pairs'
 
     def __init__(self,
                  begin_message = 16,
@@ -66,6 +117,8 @@ class TwoByteEncoder(Encoder):
         _message = [0, self.begin_message]
 
         for pos, i in data:
+            if not (0 <= i < 32 and 0 <= pos < 2048):
+                self._out_of_range(pos, i)
             foo1 = pos << 5
             foo1 += i
             n1 = foo1 >> 8
@@ -75,8 +128,171 @@ class TwoByteEncoder(Encoder):
         _message.append(self.end_message)
         return bytes(_message)
 
+    def max_frame_size(self, n):
+        return 3 + 2 * n
+
+    def encode_into(self, data, buffer, offset=0):
+        start = offset
+        if offset + 2 > len(buffer):
+            raise ValueError("buffer too small")
+
+        buffer[offset] = 0
+        buffer[offset + 1] = self.begin_message
+        offset += 2
+
+        try:
+            for pos, i in data:
+                if not (0 <= i < 32 and 0 <= pos < 2048):
+                    self._out_of_range(pos, i)
+                foo1 = (pos << 5) + i
+                buffer[offset] = foo1 >> 8
+                buffer[offset + 1] = foo1 & 255
+                offset += 2
+            buffer[offset] = self.end_message
+        except IndexError:
+            raise ValueError(f"buffer too small for a frame starting at {start}") from None
+
+        return offset + 1
+
+    @staticmethod
+    def _out_of_range(pos, i):
+        if not 0 <= i < 32:
+            raise ValueError(f"channel {i} does not fit the two_byte encoding, which carries "
+                             f"channels 0 to 31. use the delta encoder for more servos")
+        raise ValueError(f"position {pos} does not fit the two_byte encoding, which carries "
+                         f"positions 0 to 2047")
+
+
+def _crc16_table():
+    table = []
+    for b in range(256):
+        crc = b << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) & 0xFFFF if crc & 0x8000 else (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data, crc=0xFFFF):
+    """
+    CRC-16/CCITT-FALSE, polynomial 0x1021, the checksum used by DeltaEncoder frames
+    """
+    for b in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16_TABLE[(crc >> 8) ^ b]
+    return crc
+
+
+def cobs_encode(data):
+    """
+    consistent overhead byte stuffing, removes every zero byte so zero can mark the end
+    of a frame. costs one byte per 254 bytes of data
+    """
+    out = bytearray(1)
+    code_index = 0
+    code = 1
+    for b in data:
+        if b == 0:
+            out[code_index] = code
+            code_index = len(out)
+            out.append(0)
+            code = 1
+            continue
+
+        out.append(b)
+        code += 1
+        if code == 0xFF:
+            out[code_index] = code
+            code_index = len(out)
+            out.append(0)
+            code = 1
+
+    out[code_index] = code
+    return bytes(out)
+
+
+class DeltaEncoder(Encoder):
+    """
+    compact binary protocol for large servo counts. data is (position, channel) pairs like
+    TwoByteEncoder. a frame, before framing, is
+
+        flags (1 byte) | channel bitmask (n_channels / 8 bytes) | positions | crc16 (2 bytes)
+
+    only channels whose position differs from the last one sent are set in the bitmask and
+    carried, lowest channel first. positions are big endian uint16 or, with deltas=True and
+    when every change fits, int8 deltas (flags bit 0). the frame is COBS encoded and ends in
+    a zero byte so the receiver can resync after a corrupted frame, and a frame with a bad
+    crc is dropped instead of moving a servo.
+
+    every keyframe_interval frames, and after reset(), a keyframe with absolute positions
+    (flags bit 1) is sent so a receiver that dropped a delta frame catches up
+    """
+    data_format = 'pairs'
+
+    DELTA = 1
+    KEYFRAME = 2
+
+    def __init__(self,
+                 n_channels=32,
+                 deltas=True,
+                 keyframe_interval=50
+                 ):
+        if not 0 < n_channels <= 256:
+            raise ValueError("n_channels must be between 1 and 256")
+
+        self.n_channels = n_channels
+        self.mask_size = (n_channels + 7) // 8
+        self.deltas = deltas
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """
+        forget what was sent, the next frame is a keyframe
+        """
+        self._last = {}
+        self._since_keyframe = None
+
+    def encode_data(self, data):
+        keyframe = self._since_keyframe is None or (
+            self.keyframe_interval and self._since_keyframe + 1 >= self.keyframe_interval)
+
+        # keyframes carry every channel sent so far so the receiver fully resyncs
+        changed = dict(self._last) if keyframe else {}
+        for pos, i in data:
+            if not 0 <= i < self.n_channels:
+                raise ValueError(f"channel {i} out of range for {self.n_channels} channels")
+            if not 0 <= pos <= 0xFFFF:
+                raise ValueError(f"position {pos} does not fit in 16 bits")
+            if keyframe or self._last.get(i) != pos:
+                changed[i] = pos
+
+        channels = sorted(changed)
+        flags = self.KEYFRAME if keyframe else 0
+
+        if not keyframe and self.deltas and all(
+                i in self._last and -128 <= changed[i] - self._last[i] <= 127 for i in channels):
+            flags |= self.DELTA
+            values = bytes((changed[i] - self._last[i]) & 0xFF for i in channels)
+        else:
+            values = b''.join(changed[i].to_bytes(2, 'big') for i in channels)
+
+        mask = 0
+        for i in channels:
+            mask |= 1 << i
+
+        payload = bytes((flags,)) + mask.to_bytes(self.mask_size, 'little') + values
+        payload += crc16(payload).to_bytes(2, 'big')
 
+        self._last.update(changed)
+        self._since_keyframe = 0 if keyframe else self._since_keyframe + 1
 
+        return cobs_encode(payload) + b'\x00'
 
+    def max_frame_size(self, n):
+        # keyframes carry every channel ever sent, so size for all of them
+        payload = 1 + self.mask_size + 2 * self.n_channels + 2
+        return payload + payload // 254 + 2
 
-    
\ No newline at end of file
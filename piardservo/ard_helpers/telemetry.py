@@ -0,0 +1,153 @@
+"""
+servo feedback from the arduino. with telemetry on, everything the board sends is framed
+so feedback never gets mistaken for an acknowledgement
+
+    ack        0x06 | ack byte
+    telemetry  0x02 | channel | position (uint16) | current (int16) | load (int16) | checksum
+
+multi byte fields are big endian and the checksum is the sum of the 7 bytes between the
+marker and itself, mod 256
+"""
+import threading
+from array import array
+from collections import namedtuple
+
+ACK_MARKER = 0x06
+TELEMETRY_MARKER = 0x02
+TELEMETRY_SIZE = 8
+
+TelemetryRecord = namedtuple('TelemetryRecord', ['timestamp', 'channel', 'position', 'current', 'load'])
+
+
+def encode_telemetry(channel, position, current=0, load=0):
+    """
+    builds a telemetry frame the way the sketch does, used by fakes and tests
+    """
+    body = bytes((channel,)) + position.to_bytes(2, 'big') + current.to_bytes(2, 'big', signed=True) \
+        + load.to_bytes(2, 'big', signed=True)
+    return bytes((TELEMETRY_MARKER,)) + body + bytes((sum(body) & 0xFF,))
+
+
+def encode_ack(ack):
+    return bytes((ACK_MARKER, ack))
+
+
+class TelemetryParser:
+    """
+    splits the incoming byte stream into acks and telemetry records. bytes outside of a
+    frame and frames with a bad checksum are counted in dropped
+    """
+
+    def __init__(self):
+        self.dropped = 0
+        self._state = None
+        self._body = bytearray()
+
+    def feed(self, data, timestamp, on_ack, on_record):
+        for b in data:
+            state = self._state
+
+            if state is None:
+                if b == ACK_MARKER:
+                    self._state = 'ack'
+                elif b == TELEMETRY_MARKER:
+                    self._state = 'telemetry'
+                    self._body.clear()
+                else:
+                    self.dropped += 1
+
+            elif state == 'ack':
+                self._state = None
+                on_ack(b)
+
+            elif len(self._body) < TELEMETRY_SIZE - 1:
+                self._body.append(b)
+
+            else:
+                self._state = None
+                body = self._body
+                if sum(body) & 0xFF != b:
+                    self.dropped += 1
+                    continue
+                on_record(timestamp,
+                          body[0],
+                          int.from_bytes(body[1:3], 'big'),
+                          int.from_bytes(body[3:5], 'big', signed=True),
+                          int.from_bytes(body[5:7], 'big', signed=True))
+
+
+class TelemetryBuffer:
+    """
+    fixed size ring buffer of telemetry records held in preallocated arrays, so recording
+    never allocates. the oldest records are overwritten once capacity is reached
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._timestamp = array('d', bytes(8 * capacity))
+        self._channel = array('H', bytes(2 * capacity))
+        self._position = array('H', bytes(2 * capacity))
+        self._current = array('h', bytes(2 * capacity))
+        self._load = array('h', bytes(2 * capacity))
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __str__(self):
+        return f'<TelemetryBuffer(capacity={self.capacity}, records={len(self)})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def clear(self):
+        with self._lock:
+            self.total = 0
+            self._latest.clear()
+
+    def append(self, timestamp, channel, position, current=0, load=0):
+        with self._lock:
+            k = self.total % self.capacity
+            self._timestamp[k] = timestamp
+            self._channel[k] = channel
+            self._position[k] = position
+            self._current[k] = current
+            self._load[k] = load
+            # slot and the total it was written at, the slot is stale once total moves a lap past it
+            self._latest[channel] = (k, self.total)
+            self.total += 1
+
+    def _record(self, k):
+        return TelemetryRecord(self._timestamp[k], self._channel[k], self._position[k],
+                               self._current[k], self._load[k])
+
+    def latest(self, channel=None):
+        """
+        the newest record, for one channel or over all of them. None if there isn't one
+        still in the buffer
+        """
+        with self._lock:
+            if channel is None:
+                return self._record((self.total - 1) % self.capacity) if self.total else None
+
+            slot = self._latest.get(channel)
+            if slot is None or self.total - slot[1] > self.capacity:
+                return None
+            return self._record(slot[0])
+
+    def since(self, timestamp, channel=None):
+        """
+        records newer than timestamp still in the buffer, oldest first
+        """
+        with self._lock:
+            out = []
+            for n in range(self.total - 1, max(self.total - self.capacity, 0) - 1, -1):
+                k = n % self.capacity
+                if self._timestamp[k] <= timestamp:
+                    break
+                if channel is None or self._channel[k] == channel:
+                    out.append(self._record(k))
+            out.reverse()
+            return out
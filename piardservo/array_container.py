@@ -0,0 +1,173 @@
+"""
+numpy backed ServoContainer. the per servo state lives in contiguous arrays so clamping and
+angle <-> value <-> pulse width conversions run over every channel at once
+"""
+try:
+    import numpy as np
+except Exception:
+    np = None
+    print("Array Container Dependency, numpy, Not Found")
+
+from piardservo.container import ServoContainer
+from piardservo.servo_object import ServoObject
+
+
+def _array_field(name, conversion=False):
+    """
+    property that reads and writes one element of the container array called name.
+    conversion fields drop the servo's cached conversion coefficients when set
+    """
+    def fget(self):
+        return self._arrays[name][self._i].item()
+
+    def fset(self, x):
+        self._arrays[name][self._i] = x
+        if conversion is True:
+            self._coefficients.clear()
+
+    return property(fget, fset)
+
+
+class ArrayServoObject(ServoObject):
+    """
+    ServoObject whose angle, limits, flip and pulse width bounds are views onto
+    index i of its ArrayServoContainer's arrays
+    """
+
+    def __init__(self, *args, container=None, **kwargs):
+        self._arrays = container._arrays
+        super().__init__(*args, container=container, **kwargs)
+
+    _angle = _array_field('angle')
+    min_angle = _array_field('min_angle')
+    max_angle = _array_field('max_angle')
+    servo_min = _array_field('servo_min', conversion=True)
+    servo_max = _array_field('servo_max', conversion=True)
+    flip = _array_field('flip', conversion=True)
+    _min_pulse_width = _array_field('min_pulse_width', conversion=True)
+    _max_pulse_width = _array_field('max_pulse_width', conversion=True)
+
+
+class ArrayServoContainer(ServoContainer):
+    """
+    drop in replacement for ServoContainer that keeps servo state in numpy arrays.
+    container[i] still returns a ServoObject, which reads and writes through to the arrays,
+    while angles(), values(), pulse_widths() and get_values() are computed vectorized
+    """
+    _servo_class = ArrayServoObject
+    _array_names = ('angle', 'min_angle', 'max_angle', 'servo_min', 'servo_max', 'flip',
+                    'min_pulse_width', 'max_pulse_width')
+
+    def __init__(self, n=1, **kwargs):
+        if np is None:
+            raise ImportError("ArrayServoContainer requires numpy")
+
+        self._arrays = {name: np.zeros(n, dtype=np.float64) for name in self._array_names}
+        self._arrays['flip'] = np.zeros(n, dtype=bool)
+
+        super().__init__(n=n, **kwargs)
+
+    def array(self, name):
+        """
+        the live array behind a servo attribute. writes to it bypass clamping, dirty tracking
+        and the servos' cached conversions, call refresh() after changing limits this way
+        """
+        return self._arrays[name]
+
+    def refresh(self):
+        """
+        drops every servo's cached conversion coefficients
+        """
+        for servo in self.servos:
+            servo._coefficients.clear()
+
+    def _unit(self):
+        """
+        position of every servo within its range as 0 to 1, after flipping
+        """
+        a = self._arrays
+        u = (a['angle'] - a['servo_min']) / (a['servo_max'] - a['servo_min'])
+        return np.where(a['flip'], 1 - u, u)
+
+    def angle_array(self):
+        return self._arrays['angle'].copy()
+
+    def value_array(self):
+        return self._unit() * 2 - 1
+
+    def pulse_width_array(self):
+        a = self._arrays
+        return self._unit() * (a['max_pulse_width'] - a['min_pulse_width']) + a['min_pulse_width']
+
+    def angles(self):
+        return tuple(self._arrays['angle'].tolist())
+
+    def values(self):
+        return tuple(self.value_array().tolist())
+
+    def pulse_widths(self):
+        return tuple(self.pulse_width_array().tolist())
+
+    def get_values(self, name):
+        """
+        get's a tuple of values from the servos
+        """
+        if name in self._arrays:
+            return tuple(self._arrays[name].tolist())
+        elif name == 'angle':
+            return self.angles()
+        elif name == 'value':
+            return self.values()
+        elif name == 'pulse_width':
+            return self.pulse_widths()
+        return super().get_values(name)
+
+    def values_to_angles(self, values, indices=slice(None)):
+        """
+        converts an array of values in [-1, 1] to angles for every servo, or for the
+        servos at indices
+        """
+        return self._angles_from_unit((np.asarray(values, dtype=np.float64) + 1) / 2, indices)
+
+    def pulse_widths_to_angles(self, pulse_widths, indices=slice(None)):
+        """
+        converts an array of pulse widths to angles for every servo, or for the
+        servos at indices
+        """
+        a = self._arrays
+        pw = np.asarray(pulse_widths, dtype=np.float64)
+        min_pw = a['min_pulse_width'][indices]
+        return self._angles_from_unit((pw - min_pw) / (a['max_pulse_width'][indices] - min_pw), indices)
+
+    def clamp(self, angles, indices=slice(None)):
+        """
+        clamps an array of angles to every servo's min and max angle, or to those of the
+        servos at indices
+        """
+        return np.clip(angles, self._arrays['min_angle'][indices], self._arrays['max_angle'][indices])
+
+    def _set_many(self, data, measure, write):
+        if isinstance(data, dict):
+            indices = np.fromiter(data.keys(), dtype=np.intp, count=len(data))
+            xs = np.fromiter(data.values(), dtype=np.float64, count=len(data))
+            if len(indices) and (indices.min() < 0 or indices.max() >= self.n):
+                raise IndexError(f"servo index out of range for {self.n} servos")
+        else:
+            xs = np.asarray(data, dtype=np.float64)
+            if xs.shape != (self.n,):
+                raise ValueError(f"expected {self.n} values, got {len(xs)}")
+            indices = np.arange(self.n)
+
+        if measure == 'value':
+            xs = self.values_to_angles(xs, indices)
+        elif measure == 'pulse_width':
+            xs = self.pulse_widths_to_angles(xs, indices)
+
+        self._arrays['angle'][indices] = self.clamp(xs, indices)
+        self._finish_set(indices.tolist(), write)
+
+    def _angles_from_unit(self, u, indices=slice(None)):
+        a = self._arrays
+        u = np.where(a['flip'][indices], 1 - u, u)
+        servo_min = a['servo_min'][indices]
+        return u * (a['servo_max'][indices] - servo_min) + servo_min
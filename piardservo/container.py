@@ -1,13 +1,15 @@
-import sys, tty, os, termios, signal
+import threading
+import time
 
 from piardservo.servotools import servo_param_setter
+from piardservo.flusher import FlushScheduler
 import piardservo.servo_object as servo_object
 import piardservo.microcontrollers as micro
 
-# TODO: Allow for one container to control multiple microcontrollers
 class ServoContainer:
 
     # microcontroller: micro.MicroController
+    _servo_class = servo_object.ServoObject
 
     def __init__(self,
                  n=1,
@@ -23,13 +25,36 @@ class ServoContainer:
                  max_pulse_width=2000,
                  connect=True,
                  microcontroller=None,
+                 flush_policy='immediate',
+                 flush_rate=50,
                  ):
+        """
+        microcontroller can be a list of microcontrollers, which are wrapped in a
+        MicroControllerGroup that gives each one the next controller.n servos.
 
+        flush_policy decides what happens when a servo with write_on_update changes angle,
+        'immediate' writes right away, 'fixed_rate' lets a background thread write the
+        latest angles at most flush_rate times a second and 'manual' waits for write().
+        see FlushScheduler
+        """
         self._n = n
         self._connect = connect
         self.angle_format = angle_format
+        if isinstance(microcontroller, (list, tuple)):
+            microcontroller = micro.MicroControllerGroup(microcontroller)
+
         self.microcontroller = microcontroller
         self.microcontroller.container = self
+        self.flusher = FlushScheduler(self.write, policy=flush_policy, rate=flush_rate)
+
+        # indices of servos whose angle has changed since the last write
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        # perf_counter time of the oldest unwritten change, only tracked while metrics are on
+        self._dirty_since = None
+        self._popped_since = None
+        # Recorder set by start_recording
+        self.recorder = None
 
         _min_angle = servo_param_setter(n, min_angle)
         _max_angle = servo_param_setter(n, max_angle)
@@ -44,27 +69,22 @@ class ServoContainer:
         self.servos = []
 
         for i in range(n):
-            servo = servo_object.ServoObject(i=i,
-                                             min_angle=_min_angle[i],
-                                             max_angle=_max_angle[i],
-                                             initial_angle=_initial_angle[i],
-                                             center_angle_offset=_update_center_offset[i],
-                                             angle_format=angle_format,
-                                             flip=_flip[i],
-                                             servo_range=_servo_range[i],
-                                             step_size=_step_size[i],
-                                             min_pulse_width=_min_pulse_width[i],
-                                             max_pulse_width=_max_pulse_width[i],
-                                             container=self
-                                             )
+            servo = self._servo_class(i=i,
+                                      min_angle=_min_angle[i],
+                                      max_angle=_max_angle[i],
+                                      initial_angle=_initial_angle[i],
+                                      center_angle_offset=_update_center_offset[i],
+                                      angle_format=angle_format,
+                                      flip=_flip[i],
+                                      servo_range=_servo_range[i],
+                                      step_size=_step_size[i],
+                                      min_pulse_width=_min_pulse_width[i],
+                                      max_pulse_width=_max_pulse_width[i],
+                                      container=self
+                                      )
 
             self.servos.append(servo)
 
-        try:
-            self._stdin_old = termios.tcgetattr(sys.stdin)
-        except:
-            self._stdin_old = None
-
     def __getitem__(self, i):
         return self.servos[i]
 
@@ -96,79 +116,310 @@ class ServoContainer:
             out.append(getattr(servo, name))
         return tuple(out)
 
+    def set_angles(self, angles, write=True):
+        """
+        sets many servos at once. angles is a sequence or array with one angle per servo
+        or a {index: angle} mapping. every angle is clamped, the servos are marked dirty
+        and, if write is True and the connection is open, sent in a single write
+        """
+        self._set_many(angles, 'angle', write)
+
+    def set_values(self, values, write=True):
+        """
+        same as set_angles but takes values in [-1, 1]
+        """
+        self._set_many(values, 'value', write)
+
+    def set_pulse_widths(self, pulse_widths, write=True):
+        """
+        same as set_angles but takes pulse widths
+        """
+        self._set_many(pulse_widths, 'pulse_width', write)
+
+    def _set_many(self, data, measure, write):
+        indices, xs = self._split_indexed(data)
+
+        for i, x in zip(indices, xs):
+            servo = self.servos[i]
+            servo._angle = servo.clamp(servo.to_angle(x, measure))
+
+        self._finish_set(indices, write)
+
+    def _finish_set(self, indices, write):
+        self.mark_dirty(indices)
+        if write is True and self.microcontroller.is_open():
+            self.write()
+
+    def _split_indexed(self, data):
+        """
+        splits a mapping or a full length sequence into lists of indices and values
+        """
+        if isinstance(data, dict):
+            indices = list(data.keys())
+            xs = list(data.values())
+            for i in indices:
+                if not 0 <= i < self.n:
+                    raise IndexError(f"servo index {i} out of range for {self.n} servos")
+            return indices, xs
+
+        if len(data) != self.n:
+            raise ValueError(f"expected {self.n} values, got {len(data)}")
+        # numpy arrays convert to python numbers
+        xs = data.tolist() if hasattr(data, 'tolist') else list(data)
+        return list(range(self.n)), xs
+
+    @property
+    def dirty(self):
+        """
+        indices of the servos waiting to be written
+        """
+        return frozenset(self._dirty)
+
+    def mark_dirty(self, indices):
+        """
+        flags servos as waiting to be written, takes an index or an iterable of indices
+        """
+        if isinstance(indices, int):
+            indices = (indices,)
+
+        with self._dirty_lock:
+            if self._dirty_since is None and self.microcontroller.metrics.enabled:
+                self._dirty_since = time.perf_counter()
+            for i in indices:
+                self.servos[i]._is_written = False
+                self._dirty.add(i)
+
+    def mark_clean(self, indices):
+        """
+        flags servos as written, takes an index or an iterable of indices
+        """
+        if isinstance(indices, int):
+            indices = (indices,)
+
+        with self._dirty_lock:
+            for i in indices:
+                self.servos[i]._is_written = True
+                self._dirty.discard(i)
+
+    def pop_dirty(self):
+        """
+        atomically takes the sorted indices of every servo waiting to be written and marks
+        them written. backends should mark_dirty them again if sending fails
+        """
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+            for i in dirty:
+                self.servos[i]._is_written = True
+            self._popped_since, self._dirty_since = self._dirty_since, None
+
+        if self._popped_since is not None:
+            self.microcontroller.metrics.observe('staleness', time.perf_counter() - self._popped_since)
+
+        return sorted(dirty)
+
     def connect(self):
         """
         orders the microcontroller to connect
         """
         self.microcontroller.connect()
+        self.flusher.start()
         return self
 
     def write(self):
         """
         orders the microcontroller to write
         """
-        self.microcontroller.write()
+        recorder = self.recorder
+        if recorder is None:
+            self._write()
+            return
+
+        # the servos that are dirty now are the ones the write sends
+        channels = sorted(self.dirty)
+        now = time.monotonic()
+        self._write()
+        recorder.record(channels, self.angles(), now)
+
+    def _write(self):
+        metrics = self.microcontroller.metrics
+        if not metrics.enabled:
+            self.microcontroller.write()
+            return
+
+        tick = time.perf_counter()
+        try:
+            self.microcontroller.write()
+        except Exception:
+            metrics.count('errors')
+            raise
+        tock = time.perf_counter()
+
+        metrics.count('writes')
+        metrics.observe('write', tock - tick)
+        if self._popped_since is not None:
+            metrics.observe('set_to_written', tock - self._popped_since)
+            self._popped_since = None
+
+    def start_recording(self, path, buffer_records=4096):
+        """
+        records every servo each write sends to path, see piardservo.recorder. returns
+        the Recorder
+        """
+        from piardservo.recorder import Recorder
+
+        self.stop_recording()
+        self.recorder = Recorder(path, buffer_records=buffer_records)
+        return self.recorder
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def metrics(self):
+        """
+        snapshot of the microcontroller's write path metrics, see MicroController.enable_metrics
+        """
+        return self.microcontroller.metrics.snapshot()
+
+    def request_write(self):
+        """
+        called by servos with write_on_update, hands the write to the flush policy
+        """
+        self.flusher.request()
+
+    def flush(self):
+        """
+        writes any updates the flush policy is still holding
+        """
+        self.flusher.flush()
+
+    def flush_stats(self):
+        return self.flusher.stats()
 
     def close(self):
         """
         closes the microcontroller connection
         """
-        self.microcontroller.close()
-
-    def keyboard(self, move_keys=None, close_on_finish=False):
-        if self._stdin_old is None:
-            raise RuntimeError("Keyboard control is only available through a non-emulated terminal, which may prevent \
-                                it functioning properly in certain IDE's or Jupyter Notebooks")
-
-        if move_keys is None:
-            move_keys = [
-                [['a', 'left'], ['d', 'right']],
-                [['s', 'down'], ['w', 'up']]
-            ]
-        assert len(move_keys) == self.n
-        # graceful quit function for sigint and sigterm using signal module
-        def restore_keyboard(sig=None, frame=None):
-            #reset settings, clean-up, close factory
-            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self._stdin_old)
-            os.system('stty sane')
-            print('keyboard control relinquished')
-            if close_on_finish is True:
-                self.close()
-                print('connection to ')
-
-        # signal catchers
-        signal.signal(signal.SIGTERM, restore_keyboard)
-        signal.signal(signal.SIGINT, restore_keyboard)
-        # change file descriptor setting to cbreak
-        # allows it to read each individual key press without return
-        tty.setcbreak(sys.stdin.fileno())
-
+        self.flusher.stop()
         try:
-            while True:
-                # read/decode 3 bytes of stdin
-                pushed_key = os.read(sys.stdin.fileno(), 3).decode()
-                # change special keys to more easily readable names
-                pushed_key = special_key_name_converter(pushed_key)
-
-                if pushed_key == 'esc':
-                    break
-                else:
-                    for servo, keys in zip(self.servos, move_keys):
-
-                        if pushed_key in tuple(keys[0]):
-                            servo.angle -= servo.step_size
-                            break
-
-                        if pushed_key in tuple(keys[1]):
-                            servo.angle += servo.step_size
-                            break
-            # change keyboard settings back
-        except Exception as exc:
-            print("ERROR: ", exc)
+            self.microcontroller.close()
+        finally:
+            self.stop_recording()
 
+    async def aconnect(self):
+        """
+        async version of connect, the blocking work runs on the microcontroller's executor
+        """
+        await self.microcontroller.aconnect()
+        self.flusher.start()
+        return self
+
+    async def awrite(self):
+        """
+        async version of write. set angles with set_angles(..., write=False) or with
+        write_on_update off and then await awrite() so the loop never blocks on the link.
+        runs write() itself on the executor so async writes are instrumented like any other
+        """
+        await self.microcontroller.run_async(self.write)
+
+    async def aclose(self):
+        """
+        async version of close
+        """
+        await self.microcontroller.run_async(self.flusher.stop)
+        try:
+            await self.microcontroller.aclose()
         finally:
-            restore_keyboard()
+            self.stop_recording()
+
+    async def __aenter__(self):
+        return await self.aconnect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def keyboard(self, move_keys=None, close_on_finish=False, rate=30, accelerate=0, max_speed=4):
+        """
+        moves the servos from the keyboard until esc is pressed, see KeyboardControl. keys
+        are read rate times a second and each tick sends at most one write
+        """
+        from piardservo.keyboard import KeyboardControl
+
+        KeyboardControl(self,
+                        move_keys=move_keys,
+                        rate=rate,
+                        accelerate=accelerate,
+                        max_speed=max_speed
+                        ).run(close_on_finish=close_on_finish)
+
+
+class ContainerSlice:
+    """
+    the part of a ServoContainer that one microcontroller in a MicroControllerGroup
+    drives. local index j is container index indices[j], so backends can use their own
+    channel numbers while dirty tracking stays with the parent container
+    """
+
+    def __init__(self, container, indices):
+        self.parent = container
+        self.indices = list(indices)
+        # local indices handed over by the group for the next write
+        self.pending = []
+
+    def __getitem__(self, j):
+        return self.parent.servos[self.indices[j]]
 
+    def __iter__(self):
+        return iter(self.servos)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def n(self):
+        return len(self.indices)
+
+    @property
+    def servos(self):
+        return [self.parent.servos[i] for i in self.indices]
+
+    @property
+    def microcontroller(self):
+        return self.parent.microcontroller
+
+    def angles(self):
+        return self.get_values('angle')
+
+    def values(self):
+        return self.get_values('value')
+
+    def pulse_widths(self):
+        return self.get_values('pulse_width')
+
+    def get_values(self, name):
+        """
+        get's a tuple of values from the servos
+        """
+        return tuple([getattr(servo, name) for servo in self.servos])
+
+    @property
+    def dirty(self):
+        return frozenset(self.pending)
+
+    def mark_dirty(self, indices):
+        if isinstance(indices, int):
+            indices = (indices,)
+        self.parent.mark_dirty([self.indices[j] for j in indices])
+
+    def mark_clean(self, indices):
+        if isinstance(indices, int):
+            indices = (indices,)
+        self.parent.mark_clean([self.indices[j] for j in indices])
+
+    def pop_dirty(self):
+        pending, self.pending = self.pending, []
+        return sorted(pending)
 
 
 def special_key_name_converter(b):
@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+class FlushScheduler:
+    """
+    decides when a container's angle updates are sent to the microcontroller.
+
+    immediate  - every update is written right away
+    fixed_rate - updates only mark the servos dirty and a background thread writes the latest
+                 state at most once every 1/rate seconds
+    manual     - nothing is written until flush() or container.write() is called
+    """
+    policies = ('immediate', 'fixed_rate', 'manual')
+
+    def __init__(self, write, policy='immediate', rate=50):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {self.policies}")
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+
+        self._write = write
+        self.policy = policy
+        self.rate = rate
+
+        self.requests = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_flush = 0
+
+    def __str__(self):
+        return f'<FlushScheduler(policy={self.policy}, rate={self.rate})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def period(self):
+        return 1 / self.rate
+
+    @property
+    def coalesced(self):
+        """
+        number of update requests that were folded into another write
+        """
+        return max(self.requests - self.flushes, 0)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'requests': self.requests,
+            'flushes': self.flushes,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+        }
+
+    def reset_stats(self):
+        self.requests = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_error = None
+
+    def request(self):
+        """
+        called every time a servo wants its new angle written
+        """
+        self.requests += 1
+
+        if self.policy == 'immediate':
+            self._flush()
+        else:
+            # fixed_rate's thread or a manual flush() picks it up
+            self._pending.set()
+
+    def flush(self):
+        """
+        writes now if any update is waiting
+        """
+        if self._pending.is_set() or self.policy == 'immediate':
+            self._pending.clear()
+            self._flush()
+
+    def start(self):
+        """
+        starts the background flusher, only used by the fixed_rate policy
+        """
+        if self.policy != 'fixed_rate' or self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        if self._thread is None:
+            return
+
+        was_pending = self._pending.is_set()
+        self._stop.set()
+        self._pending.set()
+        self._thread.join()
+        self._thread = None
+
+        if not was_pending:
+            self._pending.clear()
+        if flush is True:
+            self.flush()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            if self._stop.is_set():
+                return
+
+            delay = self._last_flush + self.period - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+
+            self._pending.clear()
+            try:
+                self._flush()
+            except Exception as exc:
+                self.errors += 1
+                self.last_error = exc
+
+    def _flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            self.flushes += 1
+            self._write()
@@ -0,0 +1,226 @@
+"""
+non blocking keyboard control. the terminal is polled with selectors once per tick, every
+key that arrived since the last tick is drained and summed into one step per servo, and the
+result goes out in a single write. holding a key can't queue up movement that keeps
+playing after it is released
+"""
+import os
+import selectors
+import signal
+import sys
+import termios
+import threading
+import time
+import tty
+
+ESC = 27
+
+_SPECIAL_KEYS = {
+    127: 'backspace',
+    10: 'return',
+    32: 'space',
+    9: 'tab',
+}
+
+_ARROW_KEYS = {
+    ord('A'): 'up',
+    ord('B'): 'down',
+    ord('C'): 'right',
+    ord('D'): 'left',
+}
+
+DEFAULT_MOVE_KEYS = [
+    [['a', 'left'], ['d', 'right']],
+    [['s', 'down'], ['w', 'up']]
+]
+
+
+def read_keys(data):
+    """
+    splits bytes read from a cbreak terminal into key names. returns the keys and any
+    trailing bytes that may be the start of an escape sequence still on its way
+
+    >>> read_keys(b'a\\x1b[Dd\\x1b')
+    (['a', 'left', 'd'], b'\\x1b')
+    """
+    keys = []
+    k = 0
+    n = len(data)
+    while k < n:
+        b = data[k]
+        if b != ESC:
+            keys.append(_SPECIAL_KEYS.get(b, chr(b)))
+            k += 1
+        elif k + 1 == n or (data[k + 1] in b'[O' and k + 2 == n):
+            return keys, bytes(data[k:])
+        elif data[k + 1] in b'[O':
+            keys.append(_ARROW_KEYS.get(data[k + 2], chr(data[k + 2])))
+            k += 3
+        else:
+            keys.append('esc')
+            k += 1
+    return keys, b''
+
+
+class KeyboardControl:
+
+    def __init__(self,
+                 container,
+                 move_keys=None,
+                 rate=30,
+                 accelerate=0,
+                 max_speed=4,
+                 hold_gap=0.15,
+                 fd=None
+                 ):
+        """
+        move_keys has one [[decrease keys], [increase keys]] pair per servo. every key press
+        moves its servo by step_size.
+
+        accelerate > 0 turns on hold to accelerate, a held key's steps grow by accelerate
+        for every second it has been held, up to max_speed times step_size. a key counts
+        as held while its presses are less than hold_gap seconds apart, which is longer
+        than a terminal's auto repeat interval
+        """
+        if move_keys is None:
+            move_keys = DEFAULT_MOVE_KEYS
+        assert len(move_keys) == container.n
+
+        self.container = container
+        self.rate = rate
+        self.accelerate = accelerate
+        self.max_speed = max_speed
+        self.hold_gap = hold_gap
+        self.fd = sys.stdin.fileno() if fd is None else fd
+
+        # key -> (servo index, direction), the first servo listing a key gets it
+        self._moves = {}
+        for i, (decrease, increase) in enumerate(move_keys):
+            for key in decrease:
+                self._moves.setdefault(key, (i, -1))
+            for key in increase:
+                self._moves.setdefault(key, (i, 1))
+
+        # (servo index, direction) -> [hold started, last press]
+        self._held = {}
+        self._pending = b''
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def speed(self, move, now):
+        """
+        step multiplier for a press of move at now, tracks how long it has been held
+        """
+        held = self._held.get(move)
+        if held is None or now - held[1] > self.hold_gap:
+            held = self._held[move] = [now, now]
+        held[1] = now
+
+        if self.accelerate <= 0:
+            return 1
+        return min(1 + self.accelerate * (now - held[0]), self.max_speed)
+
+    def apply(self, keys, now=None):
+        """
+        sums keys into one move per servo and sends them in a single write. returns the
+        {index: angle} that was set and whether esc was pressed
+        """
+        now = time.monotonic() if now is None else now
+
+        steps = {}
+        for key in keys:
+            if key == 'esc':
+                return self._set(steps), True
+
+            move = self._moves.get(key)
+            if move is None:
+                continue
+            i, direction = move
+            steps[i] = steps.get(i, 0) + direction * self.speed(move, now)
+
+        return self._set(steps), False
+
+    def _set(self, steps):
+        angles = {}
+        for i, step in steps.items():
+            if step:
+                servo = self.container[i]
+                angles[i] = servo.angle + step * servo.step_size
+
+        if angles:
+            self.container.set_angles(angles)
+        return angles
+
+    def run(self, close_on_finish=False):
+        """
+        reads the keyboard until esc, SIGINT or SIGTERM and then restores the terminal
+        """
+        try:
+            old_settings = termios.tcgetattr(self.fd)
+        except termios.error:
+            raise RuntimeError("Keyboard control is only available through a non-emulated terminal, which may "
+                               "prevent it functioning properly in certain IDE's or Jupyter Notebooks") from None
+
+        # signal handlers can only be installed from the main thread
+        old_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                old_handlers[sig] = signal.signal(sig, lambda signum, frame: self.stop())
+
+        # cbreak reads each individual key press without return
+        tty.setcbreak(self.fd)
+        selector = selectors.DefaultSelector()
+        selector.register(self.fd, selectors.EVENT_READ)
+        self._stop.clear()
+        self._pending = b''
+
+        period = 1 / self.rate
+        deadline = time.monotonic()
+
+        try:
+            while not self._stop.is_set():
+                deadline += period
+                data = self._drain(selector, deadline)
+
+                keys, self._pending = read_keys(self._pending + data)
+                # a lone escape with nothing after it for a whole tick is the esc key
+                if not data and self._pending == bytes((ESC,)):
+                    keys.append('esc')
+                    self._pending = b''
+
+                _, esc = self.apply(keys)
+                if esc:
+                    break
+
+                # don't try to make up ticks lost to a slow write
+                deadline = max(deadline, time.monotonic())
+
+        except Exception as exc:
+            print("ERROR: ", exc)
+
+        finally:
+            selector.close()
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, old_settings)
+            for sig, handler in old_handlers.items():
+                signal.signal(sig, handler)
+            print('keyboard control relinquished')
+            if close_on_finish is True:
+                self.container.close()
+
+    def _drain(self, selector, deadline):
+        """
+        everything that arrives on the terminal until deadline
+        """
+        data = b''
+        while not self._stop.is_set():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or not selector.select(timeout):
+                break
+            chunk = os.read(self.fd, 1024)
+            if not chunk:
+                self._stop.set()
+                break
+            data += chunk
+        return data
@@ -0,0 +1,149 @@
+import threading
+import time
+
+from piardservo.stats import Histogram
+
+
+class ControlLoop:
+    """
+    calls callback(loop, now) rate times a second on absolute monotonic deadlines and then
+    writes the container, so time spent in the body never accumulates as drift.
+
+    when a tick overruns its deadline the policy decides what happens next
+    skip     - drop the missed ticks and wait for the next deadline in the future
+    catch_up - run the missed ticks back to back until the loop is on schedule again
+
+    stats() reports overruns, skipped ticks and histograms of the body time, the period
+    between ticks and the jitter of each tick's start against its deadline
+    """
+    policies = ('skip', 'catch_up')
+
+    def __init__(self,
+                 container,
+                 callback,
+                 rate=50,
+                 policy='skip',
+                 write=True
+                 ):
+        if policy not in self.policies:
+            raise ValueError(f"policy must be one of {self.policies}")
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+
+        self.container = container
+        self.callback = callback
+        self.rate = rate
+        self.policy = policy
+        self.write = write
+
+        self.body_time = Histogram()
+        self.period_time = Histogram()
+        self.jitter = Histogram()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.reset_stats()
+
+    def __str__(self):
+        return f'<ControlLoop(rate={self.rate}, policy={self.policy})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def period(self):
+        return 1 / self.rate
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.body_time.reset()
+        self.period_time.reset()
+        self.jitter.reset()
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'policy': self.policy,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'body_time': self.body_time.snapshot(),
+            'period': self.period_time.snapshot(),
+            'jitter': self.jitter.snapshot(),
+        }
+
+    def run(self, duration=None, ticks=None):
+        """
+        runs the loop in the calling thread until stop(), duration seconds or ticks ticks
+        """
+        self._stop.clear()
+        period = self.period
+        start = time.monotonic()
+        end = None if duration is None else start + duration
+        k = 0
+        last_start = None
+
+        while not self._stop.is_set():
+            deadline = start + k * period
+            now = time.monotonic()
+
+            if end is not None and deadline >= end:
+                break
+            if ticks is not None and k >= ticks:
+                break
+
+            if now < deadline:
+                if self._stop.wait(deadline - now):
+                    break
+                now = time.monotonic()
+
+            self.jitter.record(now - deadline)
+            if last_start is not None:
+                self.period_time.record(now - last_start)
+            last_start = now
+
+            self.callback(self, now)
+            if self.write is True:
+                self.container.write()
+
+            done = time.monotonic()
+            self.body_time.record(done - now)
+            self.ticks += 1
+            k += 1
+
+            if done > start + k * period:
+                self.overruns += 1
+                if self.policy == 'skip':
+                    missed = int((done - start) / period) + 1 - k
+                    self.skipped += missed
+                    k += missed
+
+    def start(self, **kwargs):
+        """
+        runs the loop on a background thread, takes the same arguments as run
+        """
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_thread, kwargs=kwargs, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run_thread(self, **kwargs):
+        try:
+            self.run(**kwargs)
+        finally:
+            self._thread = None
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,101 @@
+"""
+write path instrumentation. every MicroController has a metrics attribute that is the
+shared NULL_METRICS until enable_metrics() is called, so disabled instrumentation costs one
+attribute check per write
+"""
+import json
+import time
+import threading
+
+from piardservo.stats import Histogram, DEFAULT_BUCKETS
+
+
+class NullMetrics:
+    """
+    stand in used while instrumentation is off, every call is a no-op
+    """
+    enabled = False
+
+    def count(self, name, n=1):
+        pass
+
+    def observe(self, name, seconds):
+        pass
+
+    def snapshot(self):
+        return {'counters': {}, 'histograms': {}}
+
+    def export(self):
+        pass
+
+    def reset(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics:
+    """
+    counters and fixed bucket latency histograms. the backends record
+
+    counters   - writes, channels, bytes, errors, ack_errors
+    histograms - encode, transmit, ack, write (one container write) and
+                 set_to_written (first angle change of a channel until its write returns)
+
+    exporter is an optional callable that export() hands the snapshot to
+    """
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, exporter=None):
+        self.buckets = buckets
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __str__(self):
+        return f'<Metrics(counters={self.counters})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.record(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'time': time.time(),
+                'counters': dict(self.counters),
+                'histograms': {name: h.snapshot() for name, h in self.histograms.items()},
+            }
+
+    def export(self):
+        if self.exporter is not None:
+            self.exporter(self.snapshot())
+
+
+class JsonLinesExporter:
+    """
+    exporter that appends each snapshot to a file as one line of json
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, snapshot):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
@@ -1,23 +1,22 @@
 import abc
-from collections import defaultdict
-
-try:
-    import gpiozero
-except Exception as exc:
-    print("Raspberry Pi Dependency, gpiozero, Not Found")
-    raise
-
-try:
-    from gpiozero.pins.pigpio import PiGPIOFactory
-except Exception as exc:
-    print("Raspberry Pi Dependency, pigpio, Not Found")
-    raise
+import struct
+import threading
+import time
+import typing
+import weakref
 
 import piardservo.container as cont
+from piardservo.metrics import Metrics, NULL_METRICS
+from piardservo.servotools import require
+from piardservo.ard_helpers.connection import ArduinoSerialPort
+from piardservo.ard_helpers.encoders import Encoder, CommaDelimitedEncoder, TwoByteEncoder, DeltaEncoder
+
+if typing.TYPE_CHECKING:
+    import gpiozero.pins.pigpio
 
 
 class MicroController(abc.ABC):
-    container: cont.ServoContainer
+    container: 'cont.ServoContainer'
 
     def __init__(self,
                  address=None,
@@ -28,6 +27,8 @@ class MicroController(abc.ABC):
         self.container = container
         self.write_on_update = write_on_update
         self._open = False
+        self._executor = None
+        self.metrics = NULL_METRICS
 
     def __repr__(self):
         return self.__str__()
@@ -35,6 +36,50 @@ class MicroController(abc.ABC):
     def is_open(self):
         return self._open
 
+    def enable_metrics(self, exporter=None, buckets=None):
+        """
+        starts recording write path counters and latency histograms, see Metrics.
+        returns the Metrics object, container.metrics() gives its snapshot
+        """
+        kwargs = {} if buckets is None else {'buckets': buckets}
+        self.metrics = Metrics(exporter=exporter, **kwargs)
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = NULL_METRICS
+
+    @property
+    def executor(self):
+        """
+        single worker thread that runs this controller's blocking calls for the async api,
+        one worker keeps a device's connect, writes and close in order
+        """
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='piardservo-io')
+        return self._executor
+
+    async def run_async(self, function, *args):
+        """
+        awaits function(*args) on the controller's executor so the event loop keeps running
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def aconnect(self):
+        await self.run_async(self.connect)
+
+    async def awrite(self):
+        await self.run_async(self.write)
+
+    async def aclose(self):
+        try:
+            await self.run_async(self.close)
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
     @abc.abstractmethod
     def connect(self):
         """
@@ -68,21 +113,81 @@ class ArduinoMicroController(MicroController):
 
 
 class RPiWifi(RPiMicroController):
-    factory: PiGPIOFactory
-    _pi_servo_hash = defaultdict(lambda: [])
+    factory: 'gpiozero.pins.pigpio.PiGPIOFactory'
+    # host -> [PiGPIOFactory, number of RPiWifi using it]. one pigpiod connection per pi,
+    # closed and dropped when the last RPiWifi on the host closes
+    _factories = {}
+    _factories_lock = threading.Lock()
+    _instances = weakref.WeakSet()
+    # what a pigpio call raises when the socket to pigpiod is gone, send fails with an
+    # OSError and a recv that gets nothing back fails to unpack
+    _link_errors = (OSError, struct.error)
 
     @classmethod
     def close_servos_at(cls, address):
-        for servo in cls._pi_servo_hash[address]:
-            servo.close()
-        cls._pi_servo_hash[address] = []
+        for pi in list(cls._instances):
+            if pi.address == address:
+                pi.close()
+
+    @classmethod
+    def _acquire_factory(cls, host):
+        with cls._factories_lock:
+            entry = cls._factories.get(host)
+            if entry is None:
+                PiGPIOFactory = require('gpiozero.pins.pigpio', 'Raspberry Pi').PiGPIOFactory
+                entry = cls._factories[host] = [PiGPIOFactory(host=host), 0]
+            entry[1] += 1
+            return entry[0]
+
+    @classmethod
+    def _release_factory(cls, host):
+        with cls._factories_lock:
+            entry = cls._factories.get(host)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del cls._factories[host]
+                entry[0].close()
+
+    @classmethod
+    def _reconnect_factory(cls, factory, stale):
+        """
+        replaces stale, the pigpio.pi a call failed on, with a new socket to pigpiod.
+        gpiozero has no api for this, but its pins look up factory.connection on every
+        call, so swapping the socket underneath keeps every Servo built on the factory
+        usable. factory._connection is a private gpiozero attribute
+        """
+        # factories without a socket, like MockFactory, have nothing to reopen
+        if not hasattr(factory, '_connection'):
+            return
+
+        pigpio = require('pigpio', 'Raspberry Pi')
+
+        with cls._factories_lock:
+            # another RPiWifi on the same host got here first
+            if factory._connection is not stale:
+                return
+            try:
+                stale.stop()
+            except Exception:
+                pass
+            factory._connection = pigpio.pi(factory.host, factory.port)
+            if factory.connection is None:
+                raise IOError(f'failed to reconnect to {factory.host}:{factory.port}')
 
     def __init__(self,
                  address=None,
                  pins=(17, 22),
                  container=None,
-                 write_on_update=True
+                 write_on_update=True,
+                 pin_factory=None
                  ):
+        """
+        pin_factory replaces the PiGPIOFactory connection to address, for example with
+        gpiozero's MockFactory to run without a pi. otherwise every RPiWifi on the same
+        host shares one pooled PiGPIOFactory
+        """
 
         super().__init__(address=address,
                          container=container,
@@ -97,47 +202,451 @@ class RPiWifi(RPiMicroController):
         self.pins = pins
         self.n = n
 
+        self.pin_factory = pin_factory
         self.factory = None
+        self._servos = []
+        # set when a pigpio call fails because the socket dropped, gpiozero keeps
+        # reporting a dropped socket as connected
+        self._dropped = False
+        self._instances.add(self)
 
     def __str__(self):
         return f'<RPiWifi(host={self.address}, n={self.n})>'
 
+    @property
+    def connected(self):
+        """
+        False once a call has found the pigpiod socket dropped, until it is reopened
+        """
+        return self.factory is not None and not self._dropped
+
+    def _socket(self):
+        # the factory's pigpio.pi, a private gpiozero attribute. None for factories
+        # without one
+        return getattr(self.factory, '_connection', None)
+
     def connect(self):
+        """
+        connects and builds the servos. called again while open, it is a warm reconnect
+        that reopens a dropped socket and keeps the existing servos
+        """
+        if self._servos:
+            self.reconnect()
+            return
 
-        self.close_servos_at(self.address)
-        self.factory = PiGPIOFactory(host=self.address)
+        if self.factory is None:
+            if self.pin_factory is not None:
+                self.factory = self.pin_factory
+            else:
+                self.factory = self._acquire_factory(self.address)
 
         if self.container is not None:
+            try:
+                self._build_servos()
+            except Exception:
+                # a half built set of servos would be taken for a warm reconnect next time
+                self.close()
+                raise
+
+        self._open = True
+
+    def _build_servos(self):
+        gpiozero = require('gpiozero', 'Raspberry Pi')
 
-            min_pws = self.container.get_values('min_pulse_width')
-            max_pws = self.container.get_values('max_pulse_width')
-            ivs = self.container.values()
-            pi_servos = self._pi_servo_hash[self.address]
+        min_pws = self.container.get_values('min_pulse_width')
+        max_pws = self.container.get_values('max_pulse_width')
+        ivs = self.container.values()
+
+        for i, pin in enumerate(self.pins):
+            pi_servo = gpiozero.Servo(pin,
+                                      pin_factory=self.factory,
+                                      min_pulse_width=min_pws[i] / 1000000,
+                                      max_pulse_width=max_pws[i] / 1000000,
+                                      initial_value=ivs[i]
+                                      )
+
+            self._servos.append(pi_servo)
+            self.container[i].write_on_update = self.write_on_update
+
+    def reconnect(self):
+        """
+        reopens the pigpiod socket if it dropped and sends every servo its current value,
+        pigpiod may have restarted and lost them. the servos are not rebuilt, so the pins
+        are never released and the servos don't twitch
+        """
+        self._reconnect(self._socket())
 
-            for i, pin in enumerate(self.pins):
-                pi_servo = gpiozero.Servo(pin,
-                                          pin_factory=self.factory,
-                                          min_pulse_width=min_pws[i] / 1000000,
-                                          max_pulse_width=max_pws[i] / 1000000,
-                                          initial_value=ivs[i]
-                                          )
+    def _reconnect(self, stale):
+        if self._dropped:
+            self._reconnect_factory(self.factory, stale)
+            self._dropped = False
 
-                pi_servos.append(pi_servo)
-                self.container[i].write_on_update = self.write_on_update
+        self.container.pop_dirty()
+        try:
+            self._send(range(len(self._servos)))
+        except self._link_errors:
+            self._dropped = True
+            raise
 
         self._open = True
 
     def write(self):
-        _servos = self._pi_servo_hash[self.address]
-        for i, servo in enumerate(self.container.servos):
-            if servo._written is False:
-                _servos[i].value = servo.value
-                servo._written = True
+        if not self.connected:
+            # sends everything, so nothing dirty is lost
+            self.reconnect()
+            return
+
+        stale = self._socket()
+        dirty = self.container.pop_dirty()
+
+        metrics = self.metrics
+        if metrics.enabled:
+            tick = time.perf_counter()
+
+        try:
+            self._send(dirty)
+        except self._link_errors:
+            # wifi dropped or pigpiod restarted. reopen the socket and send every servo,
+            # a restarted pigpiod has lost them all
+            self._dropped = True
+            self._reconnect(stale)
+            return
+
+        if metrics.enabled:
+            metrics.observe('transmit', time.perf_counter() - tick)
+            metrics.count('channels', len(dirty))
+
+    def _send(self, channels):
+        """
+        sets the servos on channels to their container values. if a call fails the
+        channels not sent yet are marked dirty again so the next write retries them
+        """
+        _servos = self._servos
+        sent = 0
+        try:
+            for i in channels:
+                _servos[i].value = self.container[i].value
+                sent += 1
+        except Exception:
+            self.container.mark_dirty(list(channels)[sent:])
+            raise
 
     def close(self):
-        self.factory.close()
+        for pi_servo in self._servos:
+            pi_servo.close()
+        self._servos = []
+
+        if self.factory is not None and self.factory is not self.pin_factory:
+            self._release_factory(self.address)
+        self.factory = None
+        self._dropped = False
         self._open = False
 
 
+class ArduinoSerial(ArduinoMicroController):
+    """
+    arduino connected over a serial port. every write packs all servos that
+    have not been written into a single encoded frame and waits for one
+    acknowledgement from the arduino. with window > 1 writes are pipelined
+    and acks are collected in the background, see ArduinoSerialPort
+    """
+    _encoders = {
+        'two_byte': TwoByteEncoder,
+        'comma_delimited': CommaDelimitedEncoder,
+        'delta': DeltaEncoder
+    }
+
+    def __init__(self,
+                 address=3,
+                 n=2,
+                 baud_rate=9600,
+                 time_out=1,
+                 encoder='two_byte',
+                 wait=True,
+                 window=1,
+                 frame_timeout=1,
+                 telemetry=False,
+                 container=None,
+                 write_on_update=True,
+                 debug=False
+                 ):
+
+        super().__init__(address=address,
+                         container=container,
+                         write_on_update=write_on_update
+                         )
+
+        if isinstance(encoder, str):
+            if encoder not in self._encoders:
+                raise ValueError(f"encoder must be an Encoder or one of {tuple(self._encoders)}")
+            encoder = self._encoders[encoder]()
+        elif not isinstance(encoder, Encoder):
+            raise ValueError(f"encoder must be an Encoder or one of {tuple(self._encoders)}")
+
+        self.n = n
+        self.encoder = encoder
+        self.wait = wait
+
+        # frames are encoded into this buffer instead of a new bytes object per write, it
+        # is sized for the container in connect()
+        self._buffer = None
+        # one write at a time from encode to send, so no write overwrites another's frame
+        # in the shared buffer and stateful encoders' frames go out in the order they were
+        # encoded
+        self._write_lock = threading.Lock()
+        self.port = ArduinoSerialPort(address=address,
+                                      baud_rate=baud_rate,
+                                      time_out=time_out,
+                                      debug=debug,
+                                      window=window,
+                                      frame_timeout=frame_timeout,
+                                      telemetry=telemetry
+                                      )
+
+    def __str__(self):
+        return f'<ArduinoSerial(port={self.port.address}, n={self.n})>'
+
+    @property
+    def telemetry(self):
+        """
+        TelemetryBuffer of servo feedback when built with telemetry=True, otherwise None
+        """
+        return self.port.telemetry
+
+    def connect(self):
+        self.port.connect(wait=self.wait)
+
+        n = self.n if self.container is None else self.container.n
+        size = self.encoder.max_frame_size(n)
+        self._buffer = None if size is None else bytearray(size)
+
+        if self.container is not None:
+            for servo in self.container.servos:
+                servo.write_on_update = self.write_on_update
+
+        self._open = True
+
+    def write(self):
+        with self._write_lock:
+            self._write()
+
+    def _write(self):
+        dirty = self.container.pop_dirty()
+        if not dirty:
+            return
+
+        metrics = self.metrics
+        try:
+            if metrics.enabled:
+                tick = time.perf_counter()
+                message = self._encode(dirty)
+                metrics.observe('encode', time.perf_counter() - tick)
+                metrics.count('channels', len(dirty))
+                metrics.count('bytes', len(message))
+            else:
+                message = self._encode(dirty)
+
+            self.port.write(message, wait=self.wait)
+        except Exception:
+            self.container.mark_dirty(dirty)
+            # stateful encoders think the frame went out, the retry has to resend it in full
+            self.encoder.reset()
+            raise
+
+    def enable_metrics(self, exporter=None, buckets=None):
+        metrics = super().enable_metrics(exporter=exporter, buckets=buckets)
+        self.port.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        super().disable_metrics()
+        self.port.metrics = NULL_METRICS
+
+    def flush(self):
+        """
+        with window > 1, waits for every frame in flight to be acked and raises the
+        first ack error since the last flush
+        """
+        if self.port.windowed:
+            self.port.flush(self.wait)
+
+    def close(self):
+        self.port.close()
+        self._open = False
+
+    def _encode(self, channels):
+        data = self._frame_data(channels)
+        if self._buffer is None:
+            return self.encoder.encode_data(data)
+
+        end = self.encoder.encode_into(data, self._buffer)
+        return memoryview(self._buffer)[:end]
+
+    def _frame_data(self, channels):
+        """
+        puts the servos on channels into the format the encoder expects, (pulse_width, channel)
+        pairs or a flat channel, pulse_width, channel, pulse_width, ... list
+        """
+        data = []
+        pairs = self.encoder.data_format == 'pairs'
+
+        for i in channels:
+            pw = int(round(self.container[i].pulse_width))
+            if pairs:
+                data.append((pw, i))
+            else:
+                data += [i, pw]
+
+        return data
+
+
+class MicroControllerGroupError(Exception):
+    """
+    raised when some of a MicroControllerGroup's controllers fail. failures maps each
+    failed controller to its exception, the other controllers still completed
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        summary = ', '.join(f'{controller}: {exc!r}' for controller, exc in failures.items())
+        super().__init__(f"{len(failures)} microcontroller(s) failed: {summary}")
+
+
+class MicroControllerGroup(MicroController):
+    """
+    lets one ServoContainer drive several microcontrollers. channels lists, for each
+    controller, the container indices of the servos it drives in its own channel order.
+    by default controllers take consecutive blocks of controller.n servos.
+
+    every write pops the container's dirty set once, splits it by controller and sends
+    each controller's share concurrently on a thread pool, so a write takes as long as
+    the slowest link instead of the sum of all of them
+    """
+
+    def __init__(self,
+                 controllers,
+                 channels=None,
+                 container=None,
+                 write_on_update=True,
+                 ):
+
+        self.controllers = list(controllers)
+
+        if channels is None:
+            channels = []
+            start = 0
+            for controller in self.controllers:
+                channels.append(list(range(start, start + controller.n)))
+                start += controller.n
+
+        if len(channels) != len(self.controllers):
+            raise ValueError("channels needs one list of servo indices per controller")
+
+        self.channels = [list(c) for c in channels]
+        flat = [i for c in self.channels for i in c]
+        if len(flat) != len(set(flat)):
+            raise ValueError("a servo can only be driven by one controller")
+
+        self.n = len(flat)
+        self._owner = {}
+        for k, c in enumerate(self.channels):
+            for local, i in enumerate(c):
+                self._owner[i] = (k, local)
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._slices = []
+        self._pool = ThreadPoolExecutor(max_workers=len(self.controllers),
+                                        thread_name_prefix='piardservo-group')
+
+        super().__init__(address=None,
+                         container=container,
+                         write_on_update=write_on_update
+                         )
+
+    def __str__(self):
+        return f'<MicroControllerGroup({", ".join(str(c) for c in self.controllers)})>'
+
+    @property
+    def container(self):
+        return self._container
+
+    @container.setter
+    def container(self, container):
+        # every servo has to have a controller, or its updates would be popped and lost
+        if container is not None and set(self._owner) != set(range(container.n)):
+            raise ValueError(f"the group drives servos {sorted(self._owner)} but the container "
+                             f"has servos 0 to {container.n - 1}")
+
+        self._container = container
+        if container is None:
+            self._slices = []
+            return
+
+        self._slices = [cont.ContainerSlice(container, c) for c in self.channels]
+        for controller, container_slice in zip(self.controllers, self._slices):
+            controller.container = container_slice
+
+    def connect(self):
+        self._run_all({k: controller.connect for k, controller in enumerate(self.controllers)})
+
+        if self.container is not None:
+            for servo in self.container.servos:
+                servo.write_on_update = self.write_on_update
+
+        self._open = True
+
+    def write(self):
+        jobs = {}
+        failed_indices = {}
+        for i in self.container.pop_dirty():
+            k, local = self._owner[i]
+            if k not in jobs:
+                jobs[k] = []
+                failed_indices[k] = []
+            jobs[k].append(local)
+            failed_indices[k].append(i)
+
+        for k, locals_ in jobs.items():
+            self._slices[k].pending = locals_
+
+        try:
+            self._run_all({k: self.controllers[k].write for k in jobs})
+        except MicroControllerGroupError as exc:
+            for controller in exc.failures:
+                self.container.mark_dirty(failed_indices[self.controllers.index(controller)])
+            raise
+
+    def close(self):
+        try:
+            self._run_all({k: controller.close for k, controller in enumerate(self.controllers)})
+        finally:
+            self._open = False
+
+    def _run_all(self, calls):
+        """
+        runs {controller_index: function} concurrently and raises MicroControllerGroupError
+        with every failure once they have all finished
+        """
+        if len(calls) == 1:
+            # nothing to overlap, skip the pool
+            ((k, call),) = calls.items()
+            try:
+                call()
+            except Exception as exc:
+                raise MicroControllerGroupError({self.controllers[k]: exc}) from exc
+            return
+
+        futures = {k: self._pool.submit(call) for k, call in calls.items()}
+        failures = {}
+        for k, future in futures.items():
+            exc = future.exception()
+            if exc is not None:
+                failures[self.controllers[k]] = exc
+
+        if failures:
+            raise MicroControllerGroupError(failures)
+
+
 if __name__ == '__main__':
     pass
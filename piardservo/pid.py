@@ -1,36 +1,176 @@
 import time
 
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
 class PIDController:
     
-    def __init__(self, kP=1, kI=0, kD=0):
+    def __init__(self, kP=1, kI=0, kD=0, output_limits=None, integral_limit=None):
+        """
+        output_limits is an optional (min, max) the correction is clamped to. while the
+        output is clamped the integrator stops accumulating in the direction of the clamp,
+        and integral_limit optionally bounds the integrator's magnitude
+        """
         self.kP = kP
         self.kI = kI
         self.kD = kD
+        self.output_limits = output_limits
+        self.integral_limit = integral_limit
         self.initialize()
         
-    def initialize(self):
-        self.time_curr = time.time()
+    def initialize(self, now=None):
+        self.time_curr = time.perf_counter() if now is None else now
         self.time_prev = self.time_curr
         
         self.error_prev = 0
         self.cP = 0
         self.cI = 0
         self.cD = 0
+        self.correction = 0
         
     def update(self, error, sleep=0.01):
-        
-        time.sleep(sleep)
-        self.time_curr = time.time()
-        time_delta = self.time_curr - self.time_prev
+        """
+        sleeps for sleep seconds and then steps the controller. kept for existing loops
+        that rely on it for pacing, new code should call step
+        """
+        if sleep:
+            time.sleep(sleep)
+        return self.step(error)
+
+    def step(self, error, now=None):
+        """
+        updates the controller with error measured at time now, perf_counter by default,
+        and returns the correction without ever sleeping
+        """
+        self.time_curr = time.perf_counter() if now is None else now
+        # a clock that went backwards, or a caller mixing clocks, counts as no time passing
+        time_delta = max(self.time_curr - self.time_prev, 0)
         error_delta = error - self.error_prev
-        
+
+        cI = self.cI + error * time_delta
+        if self.integral_limit is not None:
+            cI = min(max(cI, -self.integral_limit), self.integral_limit)
+
         self.cP = error
-        self.cI += error * time_delta
         self.cD = (error_delta / time_delta) if time_delta > 0 else 0
-        
+
         self.time_prev = self.time_curr
         self.error_prev = error
-        
-        self.correction = sum([self.kP * self.cP, self.kI * self.cI, self.kD * self.cD])
-        
-        return self.correction
\ No newline at end of file
+
+        correction = self.kP * self.cP + self.kI * cI + self.kD * self.cD
+
+        if self.output_limits is not None:
+            low, high = self.output_limits
+            if correction > high:
+                correction = high
+                # anti-windup, only let the integrator move back out of saturation
+                cI = min(cI, self.cI)
+            elif correction < low:
+                correction = low
+                cI = max(cI, self.cI)
+
+        self.cI = cI
+        self.correction = correction
+
+        return self.correction
+
+
+class VectorPIDController:
+    """
+    n independent PID loops with their gains and state held in arrays so every axis is
+    updated in one call. update never sleeps and takes the measurement time from the
+    caller or perf_counter.
+
+    output_min/output_max clamp the corrections with the same anti-windup as
+    PIDController. built with for_container the corrections are also clamped so that
+    angle + correction stays inside each servo's min_angle and max_angle
+    """
+
+    def __init__(self,
+                 n,
+                 kP=1,
+                 kI=0,
+                 kD=0,
+                 output_min=None,
+                 output_max=None,
+                 integral_limit=None
+                 ):
+        if np is None:
+            raise ImportError("VectorPIDController requires numpy")
+
+        self.n = n
+        self.kP = self._per_axis(kP)
+        self.kI = self._per_axis(kI)
+        self.kD = self._per_axis(kD)
+        self.output_min = self._per_axis(-np.inf if output_min is None else output_min)
+        self.output_max = self._per_axis(np.inf if output_max is None else output_max)
+        self.integral_limit = self._per_axis(np.inf if integral_limit is None else integral_limit)
+
+        self.container = None
+        self.min_angle = None
+        self.max_angle = None
+
+        self.initialize()
+
+    @classmethod
+    def for_container(cls, container, **kwargs):
+        """
+        one loop per servo, with corrections limited by each servo's angle limits
+        """
+        controller = cls(container.n, **kwargs)
+        controller.container = container
+        controller.min_angle = np.array(container.get_values('min_angle'), dtype=np.float64)
+        controller.max_angle = np.array(container.get_values('max_angle'), dtype=np.float64)
+        return controller
+
+    def _per_axis(self, x):
+        return np.array(np.broadcast_to(np.asarray(x, dtype=np.float64), (self.n,)))
+
+    def initialize(self, now=None):
+        self.time_prev = time.perf_counter() if now is None else now
+        self.error_prev = np.zeros(self.n)
+        self.cP = np.zeros(self.n)
+        self.cI = np.zeros(self.n)
+        self.cD = np.zeros(self.n)
+        self.correction = np.zeros(self.n)
+
+    def update(self, errors, now=None, angles=None):
+        """
+        steps every loop with an array of errors and returns the array of corrections.
+        angles, the current servo angles, is only needed to apply the angle limits and
+        defaults to the container's angles when built with for_container
+        """
+        now = time.perf_counter() if now is None else now
+        errors = np.asarray(errors, dtype=np.float64)
+        time_delta = max(now - self.time_prev, 0)
+
+        cI = np.clip(self.cI + errors * time_delta, -self.integral_limit, self.integral_limit)
+
+        self.cP = errors
+        self.cD = (errors - self.error_prev) / time_delta if time_delta > 0 else np.zeros(self.n)
+        self.time_prev = now
+        self.error_prev = errors
+
+        raw = self.kP * self.cP + self.kI * cI + self.kD * self.cD
+
+        low, high = self.output_min, self.output_max
+        if self.min_angle is not None:
+            if angles is None:
+                angles = self.container.angles()
+            angles = np.asarray(angles, dtype=np.float64)
+            low = np.maximum(low, self.min_angle - angles)
+            high = np.minimum(high, self.max_angle - angles)
+
+        correction = np.clip(raw, low, high)
+
+        # anti-windup, saturated loops only integrate back out of saturation
+        cI = np.where(raw > high, np.minimum(cI, self.cI), cI)
+        cI = np.where(raw < low, np.maximum(cI, self.cI), cI)
+
+        self.cI = cI
+        self.correction = correction
+
+        return correction
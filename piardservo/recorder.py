@@ -0,0 +1,194 @@
+"""
+record and replay of what a container sends to its servos. a log is a small header followed
+by fixed size records
+
+    header  magic b'PSRV' | version (uint16) | record size (uint16) | start time (float64)
+    record  timestamp (float64) | channel (uint16) | 2 pad bytes | angle (float32)
+
+little endian. timestamps are seconds since the start time, which is the wall clock time the
+recording started. every channel sent in one write shares its timestamp, so the replayer
+can send them back in one write too
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+
+from piardservo.microcontrollers import MicroController
+
+MAGIC = b'PSRV'
+VERSION = 1
+HEADER = struct.Struct('<4sHHd')
+RECORD = struct.Struct('<dH2xf')
+
+
+class Recorder:
+
+    def __init__(self, path, buffer_records=4096):
+        """
+        records are packed into a buffer of buffer_records records that is written to the
+        file whenever it fills up, so memory use stays the same however long it records
+        """
+        self.path = path
+        self.records = 0
+        self._buffer = bytearray(RECORD.size * buffer_records)
+        self._used = 0
+        self._lock = threading.Lock()
+
+        self.start_time = time.time()
+        self._start = time.monotonic()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.start_time))
+
+    def __str__(self):
+        return f'<Recorder(path={self.path}, records={self.records})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def record(self, channels, angles, now=None):
+        """
+        appends a (timestamp, channel, angle) record for every channel, angles is indexed
+        by channel. now is a time.monotonic() reading and defaults to the current time
+        """
+        timestamp = (time.monotonic() if now is None else now) - self._start
+        with self._lock:
+            for i in channels:
+                if self._used == len(self._buffer):
+                    self._flush_buffer()
+                RECORD.pack_into(self._buffer, self._used, timestamp, i, angles[i])
+                self._used += RECORD.size
+                self.records += 1
+
+    def flush(self):
+        with self._lock:
+            self._flush_buffer()
+            self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def _flush_buffer(self):
+        if self._used:
+            self._file.write(memoryview(self._buffer)[:self._used])
+            self._used = 0
+
+
+class Replayer:
+
+    def __init__(self, path):
+        """
+        memory maps the log, records are read from the map as they are replayed so nothing
+        is loaded up front
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a piardservo log")
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.start_time = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} piardservo log")
+
+        # a recording cut off mid record leaves a partial one at the end, ignore it
+        self.records = (size - HEADER.size) // RECORD.size
+
+    def __str__(self):
+        return f'<Replayer(path={self.path}, records={self.records})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return self.records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def duration(self):
+        if not self.records:
+            return 0
+        return self[self.records - 1][0]
+
+    def __getitem__(self, k):
+        if not 0 <= k < self.records:
+            raise IndexError(f"record {k} out of range for {self.records} records")
+        return RECORD.unpack_from(self._map, HEADER.size + k * RECORD.size)
+
+    def __iter__(self):
+        """
+        (timestamp, channel, angle) records in the order they were written
+        """
+        unpack_from = RECORD.unpack_from
+        for offset in range(HEADER.size, HEADER.size + self.records * RECORD.size, RECORD.size):
+            yield unpack_from(self._map, offset)
+
+    def writes(self):
+        """
+        (timestamp, {channel: angle}) for every write that was recorded
+        """
+        timestamp = None
+        angles = {}
+        for t, channel, angle in self:
+            if t != timestamp and angles:
+                yield timestamp, angles
+                angles = {}
+            timestamp = t
+            angles[channel] = angle
+        if angles:
+            yield timestamp, angles
+
+    def play(self, target, speed=1):
+        """
+        sends the recorded writes to target, a ServoContainer or a MicroController with a
+        container. speed=1 keeps the original timing, speed=2 plays twice as fast and
+        speed=None sends every write as fast as the backend takes them. returns the number
+        of writes sent
+        """
+        container = target.container if isinstance(target, MicroController) else target
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive or None")
+
+        start = time.monotonic()
+        first = None
+        n = 0
+        for timestamp, angles in self.writes():
+            # timed from the first write, not from when recording started
+            if first is None:
+                first = timestamp
+            if speed is not None:
+                delay = start + (timestamp - first) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            container.set_angles(angles, write=False)
+            container.write()
+            n += 1
+        return n
+
+    def close(self):
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
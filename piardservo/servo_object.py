@@ -8,6 +8,11 @@ class ServoObject:
     # microcontroller: micro.MicroController
     # container: cont.ServoContainer
 
+    __slots__ = ('_i', 'min_angle', 'max_angle', 'servo_range', 'initial_angle', 'angle_format',
+                 'center_angle', '_servo_min', '_servo_max', '_center_angle_offset',
+                 '_min_pulse_width', '_max_pulse_width', 'step_size', '_flip', '_angle',
+                 'container', 'microcontroller', 'write_on_update', '_is_written', '_coefficients')
+
     _i_counter = 0
 
     def __init__(self,
@@ -29,6 +34,9 @@ class ServoObject:
 
         self._i = self._i_counter if i is None else i
 
+        # (from_measure, to_measure) -> (slope, intercept), emptied whenever a range or flip changes
+        self._coefficients = {}
+
         self.min_angle = min_angle
         self.max_angle = max_angle
         self.servo_range = servo_range
@@ -68,9 +76,9 @@ class ServoObject:
             self.microcontroller = microcontroller
 
         self.write_on_update = write_on_update
-        self._written = True
+        self._is_written = True
 
-        self._i_counter += 1
+        ServoObject._i_counter += 1
 
     def __str__(self):
         return f'<ServoObject(i={self._i}, a={int(self.angle)}, pw={int(self.pulse_width)}, v={self.value:.2f})>'
@@ -82,15 +90,31 @@ class ServoObject:
     def i(self):
         return self._i
 
+    @property
+    def _written(self):
+        return self._is_written
+
+    @_written.setter
+    def _written(self, written):
+        # kept for backends that flag servos directly, the container's dirty set
+        # is what the write path actually reads
+        if self.container is None:
+            self._is_written = written
+        elif written:
+            self.container.mark_clean(self._i)
+        else:
+            self.container.mark_dirty(self._i)
+
     @property
     def min_pulse_width(self):
         return self._min_pulse_width
 
     @min_pulse_width.setter
     def min_pulse_width(self, pw):
-        if issubclass(self.microcontroller, micro.RPiMicroController):
+        if isinstance(self.microcontroller, micro.RPiMicroController):
             raise AttributeError("RPi pulse width bounds cannot be changed after instantiation")
         self._min_pulse_width = pw
+        self._coefficients.clear()
 
     @property
     def max_pulse_width(self):
@@ -98,9 +122,37 @@ class ServoObject:
 
     @max_pulse_width.setter
     def max_pulse_width(self, pw):
-        if issubclass(self.microcontroller, micro.RPiMicroController):
+        if isinstance(self.microcontroller, micro.RPiMicroController):
             raise AttributeError("RPi pulse width bounds cannot be changed after instantiation")
         self._max_pulse_width = pw
+        self._coefficients.clear()
+
+    @property
+    def servo_min(self):
+        return self._servo_min
+
+    @servo_min.setter
+    def servo_min(self, angle):
+        self._servo_min = angle
+        self._coefficients.clear()
+
+    @property
+    def servo_max(self):
+        return self._servo_max
+
+    @servo_max.setter
+    def servo_max(self, angle):
+        self._servo_max = angle
+        self._coefficients.clear()
+
+    @property
+    def flip(self):
+        return self._flip
+
+    @flip.setter
+    def flip(self, flip):
+        self._flip = flip
+        self._coefficients.clear()
 
     @property
     def angle(self):
@@ -109,20 +161,16 @@ class ServoObject:
     @angle.setter
     def angle(self, new_angle):
 
-        if new_angle >= self.max_angle:
-            self._angle = self.max_angle
-        elif new_angle <= self.min_angle:
-            self._angle = self.min_angle
-        else:
-            self._angle = new_angle
-
+        self._angle = self.clamp(new_angle)
         self._written = False
 
         if self.write_on_update is True and self.microcontroller is not None:
-            if self.microcontroller.is_open():
-                self.microcontroller.write()
-            else:
+            if not self.microcontroller.is_open():
                 raise RuntimeError("MicroController connection is not open")
+            if self.container is not None:
+                self.container.request_write()
+            else:
+                self.microcontroller.write()
 
     @property
     def pulse_width(self):
@@ -155,6 +203,25 @@ class ServoObject:
         self.servo_max -= diff
         self._center_angle_offset = new_offset
 
+    def clamp(self, angle):
+        """
+        limits an angle to [min_angle, max_angle]
+        """
+        if angle >= self.max_angle:
+            return self.max_angle
+        elif angle <= self.min_angle:
+            return self.min_angle
+        else:
+            return angle
+
+    def to_angle(self, x, measure):
+        """
+        converts x from measure ('angle', 'value' or 'pulse_width') to an angle without clamping
+        """
+        if measure == 'angle':
+            return x
+        return self.__measure_convert(x, measure, 'angle')
+
     def reset(self):
         self.angle = self.initial_angle
 
@@ -176,7 +243,25 @@ class ServoObject:
             return self.servo_min, self.servo_max
 
     def __measure_convert(self, x, m0, m1, flip=None):
-        r0 = self.__get_range(m0)
-        r1 = self.__get_range(m1)
-        _flip = self.flip if flip is None else flip
-        return linear_transform(x, r0, r1, _flip)
+        if flip is not None and flip != self.flip:
+            return linear_transform(x, self.__get_range(m0), self.__get_range(m1), flip)
+
+        try:
+            slope, intercept = self._coefficients[m0, m1]
+        except KeyError:
+            slope, intercept = self._coefficients[m0, m1] = self.__coefficients(m0, m1)
+
+        return x * slope + intercept
+
+    def __coefficients(self, m0, m1):
+        """
+        slope and intercept of linear_transform from measure m0 to measure m1
+        """
+        min0, max0 = self.__get_range(m0)
+        if self.flip == 0:
+            min1, max1 = self.__get_range(m1)
+        else:
+            max1, min1 = self.__get_range(m1)
+
+        slope = (max1 - min1) / (max0 - min0)
+        return slope, min1 - min0 * slope
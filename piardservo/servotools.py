@@ -1,5 +1,20 @@
+import importlib
 from collections.abc import Iterable
 
+
+def require(module, backend, package=None):
+    """
+    imports an optional dependency the first time a backend needs it, so the package
+    imports without it and only the backend that uses it fails. package is the name to
+    report when it differs from the module's
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        missing = package or (exc.name or module).split('.')[0]
+        raise ImportError(f"{backend} Dependency, {missing}, Not Found") from exc
+
+
 def linear_transform(x, range_0, range_1, flip=0):
 
     min0, max0 = range_0
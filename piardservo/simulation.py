@@ -0,0 +1,246 @@
+"""
+simulated backend for running the control path without hardware. time is virtual, it only
+moves when advance() is called, so a simulation runs as fast as the computer allows
+"""
+import heapq
+import math
+import random
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from piardservo.microcontrollers import MicroController
+
+
+class SimulatedMicroController(MicroController):
+
+    def __init__(self,
+                 n=2,
+                 slew_rate=600,
+                 deadband=2,
+                 frame=0.02,
+                 pulse_resolution=1,
+                 latency=0,
+                 jitter=0,
+                 dt=0.001,
+                 seed=None,
+                 record=True,
+                 container=None,
+                 write_on_update=True
+                 ):
+        """
+        a servo model per channel
+
+        slew_rate       fastest a servo turns in degrees per second, a number or one per servo
+        deadband        pulse width change in microseconds too small for a servo to react to
+        frame           pwm frame length in seconds, a command takes effect at the start of
+                        the next frame. 0 applies commands as soon as they arrive
+        pulse_resolution  pulse widths are rounded to this many microseconds
+        latency, jitter   a write reaches the servos latency plus up to jitter seconds after
+                        it is sent, in the order writes were sent
+
+        advance() moves the virtual clock in steps of dt, and with record=True the actual
+        position of every servo is kept after each step, see times, trajectory and commands
+        """
+        if np is None:
+            raise ImportError("SimulatedMicroController requires numpy")
+
+        super().__init__(address=None,
+                         container=container,
+                         write_on_update=write_on_update
+                         )
+
+        self.n = n
+        self.slew_rate = np.broadcast_to(np.asarray(slew_rate, dtype=float), (n,)).copy()
+        self.deadband = deadband
+        self.frame = frame
+        self.pulse_resolution = pulse_resolution
+        self.latency = latency
+        self.jitter = jitter
+        self.dt = dt
+        self.record = record
+
+        self.time = 0.0
+        self._random = random.Random(seed)
+        # (arrival time, write number, {index: pulse width}) for writes still on the link
+        self._in_flight = []
+        self._writes = 0
+        self._last_arrival = 0.0
+
+        self._position = np.zeros(n)
+        self._command = np.zeros(n)
+        self._command_pw = np.zeros(n)
+        self._moving = np.zeros(n, dtype=bool)
+        self._deadband_angle = np.zeros(n)
+
+        self._samples = 0
+        self._times = np.empty(1024)
+        self._positions = np.empty((1024, n))
+        self._commands = np.empty((1024, n))
+
+    def __str__(self):
+        return f'<SimulatedMicroController(n={self.n}, t={self.time:.3f})>'
+
+    def connect(self):
+        """
+        starts every servo at rest on its current angle
+        """
+        if self.container is None:
+            raise RuntimeError("SimulatedMicroController needs a container")
+
+        for i, servo in enumerate(self.container):
+            span = servo.max_pulse_width - servo.min_pulse_width
+            degrees_per_us = abs(servo.to_angle(servo.max_pulse_width, 'pulse_width')
+                                 - servo.to_angle(servo.min_pulse_width, 'pulse_width')) / span
+            self._deadband_angle[i] = self.deadband * degrees_per_us
+            self._command_pw[i] = self._quantize(servo.pulse_width)
+            self._command[i] = servo.to_angle(self._command_pw[i], 'pulse_width')
+            self._position[i] = self._command[i]
+            servo.write_on_update = self.write_on_update
+
+        self._moving[:] = False
+        self._in_flight = []
+        self._last_arrival = self.time
+        self._record()
+        self._open = True
+
+    def write(self):
+        dirty = self.container.pop_dirty()
+        if not dirty:
+            return
+
+        command = {i: self.container[i].pulse_width for i in dirty}
+
+        arrival = self.time + self.latency
+        if self.jitter:
+            arrival += self._random.uniform(0, self.jitter)
+        # the link keeps writes in order
+        arrival = max(arrival, self._last_arrival)
+        self._last_arrival = arrival
+
+        if self.frame:
+            arrival = math.ceil(arrival / self.frame - 1e-9) * self.frame
+
+        heapq.heappush(self._in_flight, (arrival, self._writes, command))
+        self._writes += 1
+        self.metrics.count('channels', len(dirty))
+
+    def close(self):
+        self._in_flight = []
+        self._open = False
+
+    def clock(self):
+        """
+        virtual time in seconds, a drop in for time.monotonic
+        """
+        return self.time
+
+    def sleep(self, duration):
+        """
+        a drop in for time.sleep that advances the simulation instead of waiting
+        """
+        self.advance(duration)
+
+    def advance(self, duration):
+        """
+        runs the simulation for duration seconds of virtual time
+        """
+        end = self.time + duration
+        while self.time < end:
+            self._step_to(min(self.time + self.dt, end))
+            self._record()
+
+    def run(self, callback, rate, duration):
+        """
+        calls callback(now) rate times a second of virtual time for duration seconds,
+        like ControlLoop, with the simulation advancing between calls
+        """
+        period = 1 / rate
+        start = self.time
+        for k in range(int(round(duration * rate))):
+            callback(self.time)
+            self.advance(start + (k + 1) * period - self.time)
+
+    def positions(self):
+        """
+        actual angle of every servo right now
+        """
+        return self._position.copy()
+
+    @property
+    def times(self):
+        return self._times[:self._samples]
+
+    @property
+    def trajectory(self):
+        """
+        actual angles after every step, one row per entry in times
+        """
+        return self._positions[:self._samples]
+
+    @property
+    def commands(self):
+        """
+        commanded angles after every step as the servos saw them, after latency, frame
+        quantization and deadband
+        """
+        return self._commands[:self._samples]
+
+    def clear(self):
+        """
+        drops the recorded trajectory, keeping the current state as its first sample
+        """
+        self._samples = 0
+        self._record()
+
+    def _quantize(self, pw):
+        if not self.pulse_resolution:
+            return pw
+        return round(pw / self.pulse_resolution) * self.pulse_resolution
+
+    def _step_to(self, t):
+        in_flight = self._in_flight
+        while in_flight and in_flight[0][0] <= t:
+            arrival, _, command = heapq.heappop(in_flight)
+            self._move(arrival - self.time)
+            self.time = max(self.time, arrival)
+            self._apply(command)
+
+        self._move(t - self.time)
+        self.time = t
+
+    def _apply(self, command):
+        for i, pw in command.items():
+            self._command_pw[i] = self._quantize(pw)
+            self._command[i] = self.container[i].to_angle(self._command_pw[i], 'pulse_width')
+
+        # a servo at rest ignores targets inside its deadband
+        error = np.abs(self._command - self._position)
+        self._moving |= error > self._deadband_angle
+
+    def _move(self, h):
+        if h <= 0 or not self._moving.any():
+            return
+
+        max_step = self.slew_rate * h
+        error = self._command - self._position
+        step = np.clip(error, -max_step, max_step)
+        self._position += np.where(self._moving, step, 0)
+        self._moving &= np.abs(error) > max_step
+
+    def _record(self):
+        if not self.record:
+            return
+
+        k = self._samples
+        if k == len(self._times):
+            self._times = np.resize(self._times, 2 * k)
+            self._positions = np.resize(self._positions, (2 * k, self.n))
+            self._commands = np.resize(self._commands, (2 * k, self.n))
+
+        self._times[k] = self.time
+        self._positions[k] = self._position
+        self._commands[k] = self._command
+        self._samples += 1
@@ -0,0 +1,85 @@
+"""
+small fixed bucket statistics used by the loop runner and the write path instrumentation
+"""
+from bisect import bisect_left
+
+
+def log_buckets(low=1e-5, high=1., per_decade=4):
+    """
+    upper bucket edges spaced evenly in log space from low to high seconds
+    """
+    edges = []
+    edge = low
+    step = 10 ** (1 / per_decade)
+    while edge < high * (1 + 1e-9):
+        edges.append(edge)
+        edge *= step
+    return tuple(edges)
+
+
+DEFAULT_BUCKETS = log_buckets()
+
+
+class Histogram:
+    """
+    counts of samples below each bucket edge plus an overflow bucket. recording is a
+    bisect and an increment so it is cheap enough for every write
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def __str__(self):
+        return f'<Histogram(count={self.count}, mean={self.mean:.6f}, max={self.max})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def record(self, x):
+        self.counts[bisect_left(self.buckets, x)] += 1
+        self.count += 1
+        self.total += x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def percentile(self, q):
+        """
+        upper edge of the bucket holding the q-th percentile, max for the overflow bucket
+        """
+        if not self.count:
+            return None
+
+        target = q / 100 * self.count
+        seen = 0
+        for edge, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return min(edge, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': self.buckets,
+            'counts': tuple(self.counts),
+        }
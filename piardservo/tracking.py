@@ -0,0 +1,190 @@
+"""
+camera tracking. a detector thread hands targets to a TrackingStage as (timestamp, x, y)
+pixel positions, and every control tick the newest one is turned into angle errors, run
+through a pid per axis and sent to the pan and tilt servos in a single write
+"""
+import threading
+import time
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from piardservo.loop import ControlLoop
+from piardservo.pid import VectorPIDController
+from piardservo.stats import Histogram
+
+
+class TrackingStage:
+
+    def __init__(self,
+                 container,
+                 resolution=(640, 480),
+                 fov=(62.2, 48.8),
+                 axes=(0, 1),
+                 aim=None,
+                 kP=0.5,
+                 kI=0,
+                 kD=0,
+                 rate=30,
+                 max_age=0.2,
+                 clock=time.monotonic
+                 ):
+        """
+        resolution and fov, in pixels and degrees, are the camera's width and height. the
+        defaults are a raspberry pi camera v2. axes are the container indices of the servos
+        that turn the camera along x and along y, and a servo with flip set turns the
+        other way. aim is the pixel targets are brought to, the image center by default.
+
+        targets older than max_age seconds when a tick picks them up are dropped, and
+        timestamps must come from clock, the same clock the ticks use
+        """
+        if np is None:
+            raise ImportError("TrackingStage requires numpy")
+
+        self.container = container
+        self.axes = list(axes)
+        self.rate = rate
+        self.max_age = max_age
+        self.clock = clock
+
+        resolution = np.asarray(resolution, dtype=np.float64)
+        self.aim = resolution / 2 if aim is None else np.asarray(aim, dtype=np.float64)
+        # pinhole camera, the distance to the image plane in pixels along each axis
+        self.focal_length = resolution / 2 / np.tan(np.radians(np.asarray(fov, dtype=np.float64)) / 2)
+
+        servos = [container[i] for i in self.axes]
+        self.direction = np.array([-1.0 if servo.flip else 1.0 for servo in servos])
+
+        self.pid = VectorPIDController(len(self.axes), kP=kP, kI=kI, kD=kD)
+        self.pid.min_angle = np.array([servo.min_angle for servo in servos], dtype=np.float64)
+        self.pid.max_angle = np.array([servo.max_angle for servo in servos], dtype=np.float64)
+
+        self.latency = Histogram()
+        self.age = Histogram()
+
+        self._lock = threading.Lock()
+        self._target = None
+        self._last_update = None
+        self._loop = None
+        self.reset_stats()
+
+    def __str__(self):
+        return f'<TrackingStage(axes={self.axes}, rate={self.rate})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def running(self):
+        return self._loop is not None and self._loop.running
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.targets = 0
+        self.dropped = 0
+        self.stale = 0
+        self.writes = 0
+        self.latency.reset()
+        self.age.reset()
+
+    def stats(self):
+        """
+        dropped counts targets no tick used because a newer one came in first, stale the
+        ones that were too old by the time a tick picked them up. latency is from a
+        target's timestamp to the end of the write it caused and age from its timestamp
+        to the tick that used it
+        """
+        return {
+            'ticks': self.ticks,
+            'targets': self.targets,
+            'dropped': self.dropped,
+            'stale': self.stale,
+            'writes': self.writes,
+            'latency': self.latency.snapshot(),
+            'age': self.age.snapshot(),
+        }
+
+    def submit(self, timestamp, x, y):
+        """
+        hands over a detection, safe to call from any thread. only the newest target is
+        kept, one older than the target already waiting is ignored
+        """
+        with self._lock:
+            self.targets += 1
+            if self._target is not None:
+                self.dropped += 1
+                if timestamp < self._target[0]:
+                    return
+            self._target = (timestamp, x, y)
+
+    def angle_errors(self, x, y):
+        """
+        how far each axis servo has to turn, in degrees, to bring pixel (x, y) to the aim
+        """
+        offset = np.array((x, y), dtype=np.float64) - self.aim
+        return self.direction * np.degrees(np.arctan(offset / self.focal_length))
+
+    def tick(self, now=None):
+        """
+        one control step, uses the newest target if there is a fresh one and returns
+        the {index: angle} it sent, or None
+        """
+        now = self.clock() if now is None else now
+        self.ticks += 1
+
+        with self._lock:
+            target, self._target = self._target, None
+
+        if target is None:
+            self._check_lost(now)
+            return None
+
+        timestamp, x, y = target
+        age = now - timestamp
+        if age > self.max_age:
+            self.stale += 1
+            self._check_lost(now)
+            return None
+        self.age.record(age)
+
+        # a newly acquired target starts without the last one's integral and derivative
+        if self._last_update is None:
+            self.pid.initialize(now)
+
+        errors = self.angle_errors(x, y)
+        angles = np.array([self.container[i].angle for i in self.axes], dtype=np.float64)
+        corrections = self.pid.update(errors, now=now, angles=angles)
+
+        command = dict(zip(self.axes, (angles + corrections).tolist()))
+        self.container.set_angles(command)
+        self.writes += 1
+        self._last_update = now
+
+        self.latency.record(self.clock() - timestamp)
+        return command
+
+    def _check_lost(self, now):
+        # a target that has been gone longer than max_age is lost
+        if self._last_update is not None and now - self._last_update > self.max_age:
+            self._last_update = None
+
+    def start(self, policy='skip'):
+        """
+        runs tick rate times a second on a ControlLoop thread
+        """
+        if self.running:
+            return self._loop
+        self._loop = ControlLoop(self.container,
+                                 lambda loop, now: self.tick(now),
+                                 rate=self.rate,
+                                 policy=policy,
+                                 write=False)
+        self._loop.start()
+        return self._loop
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.stop()
+            self._loop = None
@@ -0,0 +1,435 @@
+"""
+velocity and acceleration limited multi-axis moves. a Trajectory is computed for every
+axis at once so all of them arrive together, and a TrajectoryPlayer streams its setpoints
+through a ServoContainer at a fixed rate
+"""
+import threading
+import time
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+    print("Trajectory Dependency, numpy, Not Found")
+
+
+class Trajectory:
+    """
+    time synchronized move of every axis from start to end.
+
+    profile='trapezoidal' accelerates at up to max_acceleration, cruises at up to
+    max_velocity and decelerates. profile='s_curve' uses the minimum jerk polynomial
+    10t^3 - 15t^4 + 6t^5, which has continuous acceleration. the duration is set by the
+    slowest axis and every other axis is slowed down to finish at the same time.
+    limits are in angle units per second and can be scalars or one per axis.
+
+    start_velocity is how fast each axis is already moving, so a move can take over from
+    one in progress without a jump in velocity. a trapezoidal axis moving away from end,
+    or too fast to stop before it, first brakes to rest at max_acceleration
+    """
+    profiles = ('trapezoidal', 's_curve')
+
+    # peak velocity and acceleration of the minimum jerk polynomial for a unit move in unit time
+    _s_curve_velocity = 1.875
+    _s_curve_acceleration = 5.773502691896258
+    # points the s_curve limits are checked at when it starts moving
+    _s_curve_grid = np.linspace(0, 1, 201) if np is not None else None
+
+    def __init__(self,
+                 start,
+                 end,
+                 max_velocity=90,
+                 max_acceleration=360,
+                 profile='trapezoidal',
+                 duration=None,
+                 start_velocity=0
+                 ):
+        if np is None:
+            raise ImportError("Trajectory requires numpy")
+        if profile not in self.profiles:
+            raise ValueError(f"profile must be one of {self.profiles}")
+
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        if self.start.shape != self.end.shape:
+            raise ValueError("start and end must have the same number of axes")
+
+        n = self.start.shape
+        self.max_velocity = np.broadcast_to(np.asarray(max_velocity, dtype=np.float64), n)
+        self.max_acceleration = np.broadcast_to(np.asarray(max_acceleration, dtype=np.float64), n)
+        if np.any(self.max_velocity <= 0) or np.any(self.max_acceleration <= 0):
+            raise ValueError("max_velocity and max_acceleration must be greater than 0")
+        self.start_velocity = np.broadcast_to(np.asarray(start_velocity, dtype=np.float64), n)
+
+        self.profile = profile
+        self.distance = np.abs(self.end - self.start)
+        # an axis that is moving but already at end turns back to it
+        self._direction = np.where(self.end != self.start,
+                                   np.sign(self.end - self.start),
+                                   -np.sign(self.start_velocity))
+        # start velocity along the direction of the move
+        self._u = self.start_velocity * self._direction
+
+        minimum = float(self.axis_durations().max(initial=0))
+        if duration is not None and duration < minimum:
+            raise ValueError(f"duration {duration} is shorter than the fastest possible move, {minimum}")
+        self.duration = minimum if duration is None else float(duration)
+
+        if profile == 'trapezoidal':
+            self._fit_trapezoids()
+
+    def __str__(self):
+        return f'<Trajectory(profile={self.profile}, n={self.start.size}, duration={self.duration:.3f})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    def axis_durations(self):
+        """
+        shortest time each axis could make its move in on its own
+        """
+        d, v, a, u = self.distance, self.max_velocity, self.max_acceleration, self._u
+
+        if self.profile == 's_curve':
+            return self._s_curve_durations()
+
+        # from u straight to a cruise and down to rest, when u is towards end and the axis
+        # can stop in time
+        cruise = np.minimum(v, np.sqrt(a * d + u * u / 2))
+        ramp = np.abs(cruise - u) / a
+        remaining = d - (u + cruise) / 2 * ramp - cruise * cruise / (2 * a)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at_cruise = np.where(cruise > 0, remaining / cruise, 0)
+        direct = ramp + np.maximum(at_cruise, 0) + cruise / a
+
+        # otherwise brake to rest first and move the rest of the way from there
+        brake = np.abs(u) / a
+        rest = self._rest_to_rest(np.abs(d - u * np.abs(u) / (2 * a)))
+        return np.where(self._direct(), direct, brake + rest)
+
+    def _direct(self):
+        u = self._u
+        return (u >= 0) & (u * u / (2 * self.max_acceleration) <= self.distance)
+
+    def _rest_to_rest(self, d):
+        v, a = self.max_velocity, self.max_acceleration
+        # triangular when the axis can't reach max_velocity before it has to slow down
+        return np.where(d >= v * v / a, d / v + v / a, 2 * np.sqrt(d / a))
+
+    def _s_curve_durations(self):
+        """
+        the minimum jerk polynomial plus a term that starts at start_velocity, and the
+        shortest duration that keeps both within the limits. found by bisection as the
+        peaks no longer have a closed form
+        """
+        d, v, a, u = self.distance, self.max_velocity, self.max_acceleration, self._u
+        resting = np.maximum(self._s_curve_velocity * d / v, np.sqrt(self._s_curve_acceleration * d / a))
+        if not np.any(u):
+            return resting
+
+        tau = self._s_curve_grid[:, None]
+        s1, s2 = self._s_curve_derivatives(tau)
+        h1, h2 = self._start_velocity_derivatives(tau)
+        # an axis faster than max_velocity can't be made slower at the first instant
+        v = np.maximum(v, np.abs(u))
+
+        def fits(T):
+            velocity = d * s1 / T + u * h1
+            acceleration = d * s2 / (T * T) + u * h2 / T
+            return ((np.abs(velocity) <= v * (1 + 1e-9)).all(axis=0)
+                    & (np.abs(acceleration) <= a * (1 + 1e-9)).all(axis=0))
+
+        high = resting + 2 * np.abs(u) / a + 1e-9
+        for _ in range(64):
+            short = ~fits(high)
+            if not short.any():
+                break
+            high = np.where(short, 2 * high, high)
+
+        low = np.zeros_like(high)
+        for _ in range(50):
+            middle = (low + high) / 2
+            ok = fits(middle)
+            high = np.where(ok, middle, high)
+            low = np.where(ok, low, middle)
+        return np.where(u != 0, high, resting)
+
+    @staticmethod
+    def _s_curve_derivatives(tau):
+        return (30 * tau * tau * (1 - tau) ** 2,
+                60 * tau * (1 - tau) * (1 - 2 * tau))
+
+    @staticmethod
+    def _start_velocity_derivatives(tau):
+        # h = tau - 6tau^3 + 8tau^4 - 3tau^5 has h'(0) = 1 and h = h' = h'' = 0 at the end
+        return (1 - 18 * tau ** 2 + 32 * tau ** 3 - 15 * tau ** 4,
+                -36 * tau + 96 * tau ** 2 - 60 * tau ** 3)
+
+    def _fit_trapezoids(self):
+        """
+        profile for each axis that makes it last exactly duration. an axis moving towards
+        end ramps from its start velocity to a cruise velocity, an axis that has to brake
+        first makes a move from rest in what is left of duration
+        """
+        d, a, T, u = self.distance, self.max_acceleration, self.duration, self._u
+        direct = self._direct()
+
+        # direct, cruising below u: slow to the cruise, hold it and slow to rest
+        with np.errstate(divide='ignore', invalid='ignore'):
+            below = np.where(T > u / a, (d - u * u / (2 * a)) / (T - u / a), 0)
+        # direct, cruising above u: the smaller root of the duration equation
+        b = a * T + u
+        above = (b - np.sqrt(np.maximum(b * b - 4 * (a * d + u * u / 2), 0))) / 2
+        direct_cruise = np.where(below <= u, np.maximum(below, 0), above)
+
+        self._brake = np.where(direct, 0, np.abs(u) / a)
+        self._braked = np.where(direct, 0, u * np.abs(u) / (2 * a))
+        rest = d - self._braked
+        self._sign = np.where(direct, 1, np.sign(rest))
+        self._leg = np.where(direct, d, np.abs(rest))
+        self._w = np.where(direct, u, 0)
+
+        t = T - self._brake
+        after_brake = (a * t - np.sqrt(np.maximum((a * t) ** 2 - 4 * a * self._leg, 0))) / 2
+        self._velocity = np.where(direct, direct_cruise, after_brake)
+        self._ramp = np.abs(self._velocity - self._w) / a
+
+    def sample(self, t):
+        """
+        positions at time t seconds after the start of the move. t can be a scalar,
+        returning one position per axis, or an array, returning an (len(t), n) array
+        """
+        t = np.asarray(t, dtype=np.float64)
+        scalar = t.ndim == 0
+        t = np.clip(np.atleast_1d(t), 0, self.duration)[:, None]
+
+        if self.duration == 0:
+            travelled = np.zeros((t.shape[0], self.start.size))
+        elif self.profile == 's_curve':
+            tau = t / self.duration
+            travelled = (self.distance * tau ** 3 * (10 - 15 * tau + 6 * tau * tau)
+                         + self._u * self.duration * tau * (1 - tau) ** 3 * (1 + 3 * tau))
+        else:
+            travelled = self._trapezoid(t)
+
+        positions = self.start + self._direction * travelled
+        return positions[0] if scalar else positions
+
+    def velocity(self, t):
+        """
+        velocities at time t seconds after the start of the move, shaped like sample(t)
+        """
+        t = np.asarray(t, dtype=np.float64)
+        scalar = t.ndim == 0
+        t = np.clip(np.atleast_1d(t), 0, self.duration)[:, None]
+
+        if self.duration == 0:
+            speed = np.zeros((t.shape[0], self.start.size))
+        elif self.profile == 's_curve':
+            tau = t / self.duration
+            s1, _ = self._s_curve_derivatives(tau)
+            h1, _ = self._start_velocity_derivatives(tau)
+            speed = self.distance * s1 / self.duration + self._u * h1
+        else:
+            speed = self._trapezoid(t, velocity=True)
+
+        velocities = self._direction * speed
+        return velocities[0] if scalar else velocities
+
+    def _trapezoid(self, t, velocity=False):
+        v, a, ramp, T = self._velocity, self.max_acceleration, self._ramp, self.duration
+        u, w, brake = self._u, self._w, self._brake
+        # sign of the acceleration out of w, towards the cruise velocity
+        change = np.where(v >= w, a, -a)
+        since = t - brake
+        remaining = T - t
+
+        if velocity:
+            braking = u - np.sign(u) * a * t
+            speeding_up = w + change * since
+            cruising = np.broadcast_to(v, since.shape)
+            slowing_down = a * remaining
+            moved = np.where(since < ramp, speeding_up, np.where(remaining > v / a, cruising, slowing_down))
+            return np.where(t < brake, braking, self._sign * moved)
+
+        braking = u * t - np.sign(u) * 0.5 * a * t * t
+        speeding_up = w * since + 0.5 * change * since * since
+        cruising = w * ramp + 0.5 * change * ramp * ramp + v * (since - ramp)
+        slowing_down = self._leg - 0.5 * a * remaining * remaining
+        moved = np.where(since < ramp, speeding_up, np.where(remaining > v / a, cruising, slowing_down))
+        return np.where(t < brake, braking, self._braked + self._sign * moved)
+
+    def samples(self, rate):
+        """
+        times and positions of every setpoint at rate per second, including the end point
+        """
+        steps = int(np.ceil(self.duration * rate)) + 1
+        times = np.minimum(np.arange(steps) / rate, self.duration)
+        return times, self.sample(times)
+
+
+class TrajectoryPlayer:
+    """
+    streams trajectories through a container at rate setpoints per second, one container
+    write per setpoint. move_to preempts whatever move is running and starts the new one
+    from the last setpoint sent, at the velocity the old move had there
+    """
+
+    def __init__(self,
+                 container,
+                 rate=50,
+                 max_velocity=90,
+                 max_acceleration=360,
+                 profile='trapezoidal'
+                 ):
+        if np is None:
+            raise ImportError("TrajectoryPlayer requires numpy")
+
+        self.container = container
+        self.rate = rate
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.profile = profile
+
+        self.trajectory = None
+        self.last_error = None
+        self._positions = None
+        self._move_start = 0
+        self._step = 0
+
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def __str__(self):
+        return f'<TrajectoryPlayer(rate={self.rate}, profile={self.profile})>'
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def period(self):
+        return 1 / self.rate
+
+    @property
+    def moving(self):
+        return self._positions is not None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def move_to(self, target, duration=None, **limits):
+        """
+        starts a move to target, a full sequence of angles or an {index: angle} mapping
+        with the other servos staying put. max_velocity, max_acceleration and profile can be
+        overridden per move. returns the Trajectory
+        """
+        with self._condition:
+            if self._positions is not None:
+                # take over from the last setpoint handed out, at the velocity the move had
+                # there, so a preempted move doesn't stop dead
+                k = max(self._step - 1, 0)
+                start = self._positions[k].copy()
+                start_velocity = self.trajectory.velocity(min(k * self.period, self.trajectory.duration))
+                move_start = self._move_start + k * self.period
+                step = min(self._step, 1)
+            else:
+                start = np.array(self.container.angles(), dtype=np.float64)
+                start_velocity = 0
+                move_start = time.monotonic()
+                step = 0
+
+            end = start.copy()
+            if isinstance(target, dict):
+                for i, angle in target.items():
+                    end[i] = angle
+            else:
+                end[:] = target
+
+            end = np.array([servo.clamp(angle) for servo, angle in zip(self.container.servos, end.tolist())])
+
+            trajectory = Trajectory(start,
+                                    end,
+                                    max_velocity=limits.get('max_velocity', self.max_velocity),
+                                    max_acceleration=limits.get('max_acceleration', self.max_acceleration),
+                                    profile=limits.get('profile', self.profile),
+                                    duration=duration,
+                                    start_velocity=start_velocity
+                                    )
+            _, positions = trajectory.samples(self.rate)
+
+            self.trajectory = trajectory
+            self._positions = positions
+            self._step = step
+            self._move_start = move_start
+            self._condition.notify_all()
+
+        return trajectory
+
+    def completion_time(self):
+        """
+        monotonic time the current move should finish at, None when idle
+        """
+        with self._condition:
+            if self._positions is None:
+                return None
+            return self._move_start + (len(self._positions) - 1) * self.period
+
+    def eta(self):
+        """
+        seconds until the current move should finish, 0 when idle
+        """
+        done = self.completion_time()
+        return 0 if done is None else max(done - time.monotonic(), 0)
+
+    def wait(self, timeout=None):
+        """
+        blocks until the current move has been fully sent, returns False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._positions is None, timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop or self._positions is not None)
+                if self._stop:
+                    return
+
+                positions = self._positions
+                # deadlines are absolute so slow writes don't stretch the move
+                step = max(self._step, int((time.monotonic() - self._move_start) * self.rate))
+                step = min(step, len(positions) - 1)
+                self._step = step + 1
+                deadline = self._move_start + self._step * self.period
+
+            try:
+                self.container.set_angles(positions[step])
+            except Exception as exc:
+                self.last_error = exc
+
+            with self._condition:
+                if positions is self._positions and step == len(positions) - 1:
+                    self._positions = None
+                    self._condition.notify_all()
+                    continue
+
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
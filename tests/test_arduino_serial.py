@@ -0,0 +1,72 @@
+"""
+ArduinoSerial writes against the fake board
+"""
+import sys
+import threading
+
+import pytest
+
+from fake_arduino import FakeArduino
+from piardservo.ard_helpers.decoders import TwoByteDecoder
+from piardservo.ard_helpers.encoders import TwoByteEncoder
+from piardservo.container import ServoContainer
+from piardservo.microcontrollers import ArduinoSerial
+
+
+def connected(fake, servos, **kwargs):
+    ard = ArduinoSerial(address=fake.address, write_on_update=False, **kwargs)
+    return ServoContainer(n=servos, microcontroller=ard, min_pulse_width=1000, max_pulse_width=2000).connect()
+
+
+def test_buffer_is_sized_for_the_container():
+    # ArduinoSerial's n defaults to 2, the container decides how many channels a frame carries
+    with FakeArduino(TwoByteDecoder()) as fake:
+        container = connected(fake, 6)
+        container.set_pulse_widths([1200 + 10 * i for i in range(6)])
+        container.close()
+
+    assert fake.frames == [[(1200 + 10 * i, i) for i in range(6)]]
+
+
+def test_concurrent_writers_never_send_another_writers_frame():
+    n_threads = 4
+    n_updates = 400
+    switch_interval = sys.getswitchinterval()
+
+    with FakeArduino(TwoByteDecoder()) as fake:
+        container = connected(fake, n_threads)
+
+        def move(channel):
+            # strictly increasing pulse widths, a frame sent twice shows up as a repeat
+            for k in range(n_updates):
+                container.set_pulse_widths({channel: 1200 + k})
+
+        threads = [threading.Thread(target=move, args=(i,)) for i in range(n_threads)]
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        container.close()
+
+    sent = {i: [] for i in range(n_threads)}
+    for frame in fake.frames:
+        for pw, i in frame:
+            sent[i].append(pw)
+
+    for i, pws in sent.items():
+        assert all(a < b for a, b in zip(pws, pws[1:])), f"channel {i} sent out of order or twice"
+        assert pws[-1] == 1200 + n_updates - 1
+    assert container.dirty == frozenset()
+
+
+@pytest.mark.parametrize('pair, message', (((1500, 33), 'channel 33'), ((2100, 1), 'position 2100')))
+def test_two_byte_rejects_what_it_cannot_carry(pair, message):
+    encoder = TwoByteEncoder()
+    with pytest.raises(ValueError, match=message):
+        encoder.encode_data([pair])
+    with pytest.raises(ValueError, match=message):
+        encoder.encode_into([pair], bytearray(encoder.max_frame_size(1)))
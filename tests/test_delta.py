@@ -0,0 +1,86 @@
+"""
+DeltaEncoder to DeltaDecoder round trips, including frames corrupted on the way
+"""
+import random
+
+from fake_arduino import FakeArduino
+from piardservo.ard_helpers.decoders import DeltaDecoder
+from piardservo.ard_helpers.encoders import DeltaEncoder
+from piardservo.container import ServoContainer
+from piardservo.microcontrollers import ArduinoSerial
+
+
+def corrupt(frame):
+    # change one byte in the middle without adding a zero, so the frame stays one frame
+    k = len(frame) // 2
+    return frame[:k] + bytes((frame[k] % 255 + 1,)) + frame[k + 1:]
+
+
+def test_round_trip_tracks_every_position():
+    rng = random.Random(0)
+    encoder = DeltaEncoder(n_channels=12, keyframe_interval=10)
+    decoder = DeltaDecoder(12)
+    positions = [1500] * 12
+
+    for _ in range(200):
+        for i in rng.sample(range(12), rng.randint(1, 12)):
+            # mostly small steps that go out as deltas, sometimes a jump that can't
+            step = rng.randint(-40, 40) if rng.random() < 0.8 else rng.randint(-500, 500)
+            positions[i] = min(max(positions[i] + step, 500), 2500)
+        decoder.feed(encoder.encode_data([(p, i) for i, p in enumerate(positions)]))
+
+        assert decoder.positions == dict(enumerate(positions))
+    assert decoder.bad_frames == 0
+
+
+def test_corrupted_frame_is_dropped_until_the_next_keyframe():
+    encoder = DeltaEncoder(n_channels=4, keyframe_interval=5)
+    decoder = DeltaDecoder(4)
+
+    def send(positions, damage=False):
+        frame = encoder.encode_data([(p, i) for i, p in enumerate(positions)])
+        return decoder.feed(corrupt(frame) if damage else frame)
+
+    # frame 0 is a keyframe, 1 to 4 are deltas
+    assert send([1500, 1500, 1500, 1500]) == [{0: 1500, 1: 1500, 2: 1500, 3: 1500}]
+    assert send([1510, 1500, 1500, 1500]) == [{0: 1510}]
+
+    assert send([1520, 1500, 1500, 1500], damage=True) == []
+    assert decoder.bad_frames == 1
+
+    # the deltas after the bad frame would build on a position that never arrived
+    assert send([1530, 1490, 1500, 1500]) == []
+    assert send([1540, 1480, 1500, 1500]) == []
+    assert decoder.positions[0] == 1510
+
+    # the keyframe carries every channel and resyncs the decoder
+    assert send([1550, 1470, 1500, 1500]) == [{0: 1550, 1: 1470, 2: 1500, 3: 1500}]
+    assert send([1560, 1470, 1500, 1500]) == [{0: 1560}]
+    assert decoder.positions == {0: 1560, 1: 1470, 2: 1500, 3: 1500}
+    assert decoder.bad_frames == 1
+
+
+def test_garbage_between_frames_does_not_desync_later_keyframes():
+    encoder = DeltaEncoder(n_channels=8, keyframe_interval=3)
+    decoder = DeltaDecoder(8)
+
+    decoder.feed(encoder.encode_data([(1500, 0), (1600, 1)]))
+    decoder.feed(b'\x05\x12\x34\x00')
+    assert decoder.bad_frames == 1
+
+    for pos in (1501, 1502, 1503):
+        decoder.feed(encoder.encode_data([(pos, 0), (1600, 1)]))
+    assert decoder.positions == {0: 1503, 1: 1600}
+
+
+def test_round_trip_through_the_fake_board():
+    with FakeArduino(DeltaDecoder(8)) as fake:
+        ard = ArduinoSerial(address=fake.address, n=8, encoder=DeltaEncoder(n_channels=8),
+                            write_on_update=False)
+        container = ServoContainer(n=8, microcontroller=ard).connect()
+        for k in range(20):
+            container.set_angles([(k * 7 + 11 * i) % 90 for i in range(8)])
+        container.close()
+
+    assert fake.decoder.positions == {i: round(pw) for i, pw in enumerate(container.pulse_widths())}
+    assert fake.decoder.bad_frames == 0
@@ -0,0 +1,23 @@
+"""
+MicroControllerGroup splitting one container across controllers
+"""
+import pytest
+
+from piardservo.container import ServoContainer
+from piardservo.microcontrollers import MicroControllerGroup
+from piardservo.simulation import SimulatedMicroController
+
+
+def group(channels):
+    controllers = [SimulatedMicroController(n=len(c)) for c in channels]
+    return MicroControllerGroup(controllers, channels=channels)
+
+
+def test_channels_must_cover_every_servo():
+    with pytest.raises(ValueError, match=r"drives servos \[0, 5\] but the container has servos 0 to 1"):
+        ServoContainer(n=2, microcontroller=group([[0], [5]]))
+
+
+def test_channels_can_be_in_any_order():
+    container = ServoContainer(n=3, microcontroller=group([[2, 0], [1]]))
+    assert [s.indices for s in container.microcontroller._slices] == [[2, 0], [1]]
@@ -0,0 +1,114 @@
+"""
+serial protocol tests against the fake board, no hardware needed
+"""
+import pytest
+
+from fake_arduino import FakeArduino
+from piardservo.ard_helpers.connection import ArduinoSerialPort, SerialAckError
+from piardservo.ard_helpers.decoders import TwoByteDecoder, SequencedDecoder
+from piardservo.ard_helpers.encoders import TwoByteEncoder
+
+
+class LossyArduino(FakeArduino):
+    """
+    fake board that never acks the frames in drop
+    """
+
+    def __init__(self, *args, drop=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drop = set(drop)
+
+    def _write(self, data, framed=False):
+        if self._thread is not None and self.frames:
+            data = bytes(b for b in data if b not in self.drop)
+        if data:
+            super()._write(data, framed)
+
+
+def windowed_port(fake, errors=None, **kwargs):
+    port = ArduinoSerialPort(address=fake.address, window=8, frame_timeout=0.3, min_wait=2,
+                             on_error=None if errors is None else errors.append, share=False, **kwargs)
+    port.connect()
+    return port
+
+
+def frame(position, channel=0):
+    return TwoByteEncoder().encode_data([(position, channel)])
+
+
+def test_sequenced_decoder_splits_sequence_and_frame():
+    decoder = SequencedDecoder(TwoByteDecoder())
+    data = bytes((7,)) + frame(1500, 3) + bytes((8,)) + frame(1600, 4)
+
+    decoded = []
+    for b in data:
+        out = decoder.feed_byte(b)
+        if out is not None:
+            decoded.append(out)
+
+    assert [seq for seq, _ in decoded] == [7, 8]
+    assert SequencedDecoder.ack(decoded[0]) == b'\x07'
+    assert decoded[0][1] == TwoByteDecoder().feed(frame(1500, 3))[0]
+
+
+def test_windowed_frames_arrive_in_order_and_are_all_acked():
+    errors = []
+    with FakeArduino(TwoByteDecoder(), windowed=True) as fake:
+        port = windowed_port(fake, errors)
+        positions = [1000 + k for k in range(300)]
+        for position in positions:
+            port.write(frame(position))
+        port.flush()
+
+        assert port.in_flight == 0
+        port.close()
+
+    # sequence numbers count up from 0 and wrap at 256
+    assert [seq for seq, _ in fake.frames] == [k % 256 for k in range(len(positions))]
+    assert [f for _, f in fake.frames] == [TwoByteDecoder().feed(frame(p))[0] for p in positions]
+    assert errors == []
+
+
+def test_lost_ack_is_reported_when_a_later_frame_is_acked():
+    with LossyArduino(TwoByteDecoder(), windowed=True, drop={3}) as fake:
+        port = windowed_port(fake)
+        for k in range(6):
+            port.write(frame(1500 + k))
+
+        with pytest.raises(SerialAckError) as info:
+            port.flush()
+        port.close()
+
+    assert info.value.seq == 3
+    assert 'lost or out of order' in str(info.value)
+
+
+def test_unexpected_ack_is_reported():
+    errors = []
+    with FakeArduino(TwoByteDecoder(), windowed=True) as fake:
+        port = windowed_port(fake, errors)
+        port.write(frame(1500))
+        port.flush()
+
+        # an ack for a frame that was never sent
+        fake._write(b'\x63')
+        port.write(frame(1501))
+        with pytest.raises(SerialAckError):
+            port.flush()
+        port.close()
+
+    assert [(e.seq, 'unexpected ack' in str(e)) for e in errors] == [(0x63, True)]
+
+
+def test_unacked_frame_times_out():
+    with LossyArduino(TwoByteDecoder(), windowed=True, drop={2}) as fake:
+        port = windowed_port(fake)
+        for k in range(3):
+            port.write(frame(1500 + k))
+
+        with pytest.raises(SerialAckError) as info:
+            port.flush()
+        port.close()
+
+    assert info.value.seq == 2
+    assert 'frame_timeout' in str(info.value)
@@ -0,0 +1,166 @@
+"""
+RPiWifi against gpiozero's mock pins
+"""
+import pytest
+
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+from piardservo.container import ServoContainer
+from piardservo.microcontrollers import RPiWifi
+
+
+class FlakyServo:
+    """
+    wraps a gpiozero Servo, setting value raises while failing is True
+    """
+
+    def __init__(self, servo):
+        self.servo = servo
+        self.failing = True
+
+    @property
+    def value(self):
+        return self.servo.value
+
+    @value.setter
+    def value(self, value):
+        if self.failing:
+            raise BrokenPipeError("pigpiod went away")
+        self.servo.value = value
+
+    def close(self):
+        self.servo.close()
+
+
+@pytest.fixture
+def container():
+    rpi = RPiWifi(pins=(17, 22), pin_factory=MockFactory(pin_class=MockPWMPin), write_on_update=False)
+    container = ServoContainer(n=2, microcontroller=rpi).connect()
+    yield container
+    container.close()
+
+
+def test_failed_write_keeps_unsent_servos_dirty(container):
+    rpi = container.microcontroller
+    flaky = rpi._servos[1] = FlakyServo(rpi._servos[1])
+
+    container.set_values([1 / 3, -1 / 3], write=False)
+    with pytest.raises(BrokenPipeError):
+        container.write()
+    assert container.dirty == {1}
+
+    flaky.failing = False
+    container.write()
+    assert container.dirty == frozenset()
+    assert [s.value for s in rpi._servos] == pytest.approx([1 / 3, -1 / 3])
+
+
+class FakePi:
+    """
+    stands in for a pigpio.pi, calls through it fail once alive is False
+    """
+
+    def __init__(self, host='localhost', port=8888, alive=True):
+        self.alive = alive
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeFactory:
+    """
+    the parts of a PiGPIOFactory RPiWifi touches when reconnecting
+    """
+
+    def __init__(self):
+        self.host = 'pi'
+        self.port = 8888
+        self._connection = FakePi()
+
+    @property
+    def connection(self):
+        return self._connection if self._connection.alive else None
+
+
+class SocketServo:
+    """
+    servo whose writes go through its factory's current socket, like a gpiozero pin
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if not self.factory._connection.alive:
+            raise BrokenPipeError("pigpiod went away")
+        self._value = value
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def socket_container(monkeypatch):
+    import pigpio
+
+    pigpiod = {'up': True, 'opened': []}
+
+    def pi(host, port):
+        connection = FakePi(host, port, alive=pigpiod['up'])
+        pigpiod['opened'].append(connection)
+        return connection
+
+    monkeypatch.setattr(pigpio, 'pi', pi)
+
+    factory = FakeFactory()
+    rpi = RPiWifi(address='pi', pins=(17, 22), pin_factory=factory, write_on_update=False)
+    container = ServoContainer(n=2, microcontroller=rpi)
+    rpi.factory = factory
+    rpi._servos = [SocketServo(factory), SocketServo(factory)]
+    rpi._open = True
+    yield container, factory, pigpiod
+    container.close()
+
+
+def test_dropped_socket_is_reopened_and_every_servo_resent(socket_container):
+    container, factory, pigpiod = socket_container
+    rpi = container.microcontroller
+    opened = pigpiod['opened']
+
+    container.set_values([0.5, -0.5])
+    stale = factory._connection
+    # the socket object is still there after a drop, only calls through it fail
+    stale.alive = False
+
+    container.set_values({0: 0.25})
+    assert len(opened) == 1
+    assert stale.stopped
+    assert factory._connection is opened[0]
+    assert rpi.connected
+    assert [s.value for s in rpi._servos] == [0.25, -0.5]
+    assert container.dirty == frozenset()
+
+
+def test_failed_reopen_keeps_updates_for_the_next_write(socket_container):
+    container, factory, pigpiod = socket_container
+    rpi = container.microcontroller
+
+    factory._connection.alive = False
+    pigpiod['up'] = False
+    with pytest.raises(IOError):
+        container.set_values([0.5, -0.5])
+    assert not rpi.connected
+    assert container.dirty == {0, 1}
+
+    pigpiod['up'] = True
+    container.write()
+    assert rpi.connected
+    assert [s.value for s in rpi._servos] == [0.5, -0.5]
+    assert container.dirty == frozenset()
@@ -0,0 +1,80 @@
+"""
+trajectories and the player, stepped by hand instead of on the player's thread
+"""
+import numpy as np
+import pytest
+
+from piardservo.container import ServoContainer
+from piardservo.simulation import SimulatedMicroController
+from piardservo.trajectory import Trajectory, TrajectoryPlayer
+
+RATE = 100
+MAX_VELOCITY = 90
+MAX_ACCELERATION = 360
+
+
+def player(profile):
+    container = ServoContainer(n=2, microcontroller=SimulatedMicroController(n=2))
+    return TrajectoryPlayer(container,
+                            rate=RATE,
+                            max_velocity=MAX_VELOCITY,
+                            max_acceleration=MAX_ACCELERATION,
+                            profile=profile)
+
+
+def step(player, sent):
+    # one setpoint, the way the player's thread sends it when it keeps up
+    k = player._step
+    player._step = k + 1
+    player.container.set_angles(player._positions[k])
+    sent.append(player._positions[k])
+
+
+def run_out(player, sent):
+    while player._step < len(player._positions):
+        step(player, sent)
+
+
+def accelerations(sent):
+    return np.diff(np.array(sent), n=2, axis=0) * RATE * RATE
+
+
+@pytest.mark.parametrize('profile', Trajectory.profiles)
+def test_start_velocity_carries_into_the_move(profile):
+    trajectory = Trajectory([0, 0], [30, 0], start_velocity=[-60, 45], profile=profile)
+    times = np.linspace(0, trajectory.duration, 2001)
+    velocities = trajectory.velocity(times)
+
+    assert trajectory.velocity(0) == pytest.approx([-60, 45])
+    assert trajectory.velocity(trajectory.duration) == pytest.approx([0, 0], abs=1e-9)
+    assert trajectory.sample(trajectory.duration) == pytest.approx([30, 0])
+    assert np.abs(np.diff(velocities, axis=0) / np.diff(times)[:, None]).max() <= MAX_ACCELERATION * 1.001
+
+
+@pytest.mark.parametrize('profile', Trajectory.profiles)
+@pytest.mark.parametrize('target', ([0, 0], [90, -90], [60, -70]))
+def test_preempting_a_move_keeps_the_acceleration_limit(profile, target):
+    p = player(profile)
+    sent = [np.zeros(2)]
+    p.move_to([80, -80])
+    # the first setpoint is where the servos already are
+    p._step = 1
+    for _ in range(60):
+        step(p, sent)
+    assert np.abs(np.diff(sent[-2:], axis=0)).max() * RATE > MAX_VELOCITY / 2
+
+    p.move_to(target)
+    run_out(p, sent)
+
+    assert np.abs(accelerations(sent)).max() <= MAX_ACCELERATION * 1.001
+    assert sent[-1] == pytest.approx(target)
+
+
+def test_idle_player_starts_from_rest_at_the_current_angles():
+    p = player('trapezoidal')
+    p.container.set_angles([10, 20])
+    trajectory = p.move_to({0: 40})
+
+    assert trajectory.start == pytest.approx([10, 20])
+    assert trajectory.velocity(0) == pytest.approx([0, 0])
+    assert p._step == 0